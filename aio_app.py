@@ -0,0 +1,368 @@
+#aio_app.py
+# Async serving mode. Embedding and LLM calls go through one shared
+# aiohttp session per process; MySQL and FAISS work (blocking drivers)
+# runs on a bounded thread pool so the event loop never waits on it.
+#
+#   python aio_app.py
+#   gunicorn aio_app:create_app --worker-class aiohttp.GunicornWebWorker
+import os
+import json
+import time
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from aiohttp import web
+import models
+import metrics
+from metrics import span, collect_timings, rounded, REQUEST_SECONDS, REQUEST_ERRORS
+from models import (
+    get_embedder,
+    get_embeddings,
+    lookup_embeddings,
+    remember_embeddings,
+    split_batches,
+    auth_headers,
+    embedding_payload,
+    parse_embeddings,
+    chat_payload,
+    parse_stream_line,
+    STREAM_DONE,
+    answer_cache,
+    answer_cache_key,
+    answer_cache_stats,
+    EMBED_MAX_IN_FLIGHT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_SECONDS
+)
+from intent import classify
+from vectorstore import index_holder, load_memory, index_stats, pool_stats, memory_stats, MYSQL_POOL_SIZE
+from main import SYSTEM_PROMPT, _user_prompt, _sse, plan_answer, warm_up, wants_timings, session_id_for
+
+# Threads for blocking DB/FAISS work; more than the DB pool is just queueing
+AIO_BLOCKING_THREADS = int(os.getenv("AIO_BLOCKING_THREADS", str(MYSQL_POOL_SIZE * 2)))
+
+# Max simultaneous connections to the model provider per process
+AIO_HTTP_CONNECTIONS = int(os.getenv("AIO_HTTP_CONNECTIONS", "100"))
+
+# Server port
+PORT = int(os.getenv("PORT", "5000"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Failures before the request reached the provider; read timeouts are not retried
+CONNECT_ERRORS = (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)
+
+# ---------------------------------------------------------------------------
+# PROVIDER CLIENT
+# ---------------------------------------------------------------------------
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return HTTP_BACKOFF_SECONDS * (2 ** attempt) + random.uniform(0, 0.1)
+
+async def _post(session: aiohttp.ClientSession, path, payload):
+    """
+    POST to the provider with the same backoff policy as the sync
+    session (429/5xx and failed connects, honouring Retry-After).
+    Returns an open response; the caller must release it.
+    """
+    url = f"{models.OPENROUTER_BASE_URL}{path}"
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        response = None
+        try:
+            response = await session.post(url, json=payload, headers=auth_headers())
+            if response.status not in RETRY_STATUSES or attempt == HTTP_MAX_RETRIES:
+                return response
+        except CONNECT_ERRORS:
+            if attempt == HTTP_MAX_RETRIES:
+                raise
+
+        delay = _retry_delay(response, attempt)
+        if response is not None:
+            response.release()
+        await asyncio.sleep(delay)
+
+async def _raise_for_status(response, label):
+    if response.status != 200:
+        print(f"\n{label} Error:")
+        print("Status:", response.status)
+        print("Response:", await response.text())
+        response.raise_for_status()
+
+async def embed_batch_async(session, texts):
+    response = await _post(session, "/embeddings", embedding_payload(texts))
+    async with response:
+        await _raise_for_status(response, "Embedding")
+        return parse_embeddings(await response.json(content_type=None), len(texts))
+
+async def get_embeddings_async(session, texts, batch_size=None, max_in_flight=None):
+    """Async get_embeddings: same cache tiers, batches sent concurrently."""
+    if get_embedder().name != "remote":
+        # An in-process model has no network wait to overlap; keep it off the loop
+        return await asyncio.to_thread(get_embeddings, texts, batch_size, max_in_flight)
+
+    with span("embed"):
+        keys, found, to_embed = await asyncio.to_thread(lookup_embeddings, texts)
+
+        if to_embed:
+            limit = asyncio.Semaphore(max_in_flight or EMBED_MAX_IN_FLIGHT)
+
+            async def run(batch):
+                async with limit:
+                    return await embed_batch_async(session, batch)
+
+            batches = split_batches(list(to_embed.values()), batch_size)
+            results = await asyncio.gather(*(run(b) for b in batches))
+            vectors = [vec for batch in results for vec in batch]
+            await asyncio.to_thread(remember_embeddings, found, to_embed, vectors)
+
+    return [found[key] for key in keys]
+
+async def get_embedding_async(session, text):
+    return (await get_embeddings_async(session, [text]))[0]
+
+async def call_llama_async(session, system_prompt, user_prompt):
+    with span("llm"):
+        response = await _post(session, "/chat/completions", chat_payload(system_prompt, user_prompt))
+        async with response:
+            await _raise_for_status(response, "LLM")
+            return (await response.json(content_type=None))["choices"][0]["message"]["content"]
+
+async def stream_llama_async(session, system_prompt, user_prompt):
+    with span("llm"):
+        response = await _post(session, "/chat/completions", chat_payload(system_prompt, user_prompt, stream=True))
+        async with response:
+            await _raise_for_status(response, "LLM")
+
+            async for raw in response.content:
+                piece = parse_stream_line(raw.decode("utf-8").strip())
+                if piece is STREAM_DONE:
+                    break
+                if piece:
+                    yield piece
+
+# ---------------------------------------------------------------------------
+# QA
+# ---------------------------------------------------------------------------
+
+async def plan_answer_async(session, question, group_id, session_id, intent=None):
+    """
+    plan_answer with its I/O overlapped: for searches the question is
+    embedded while session memory loads and the index snapshot warms up.
+    """
+    memory_task = asyncio.to_thread(load_memory, session_id, group_id)
+    query_vector = None
+    intent = intent or classify(question)
+
+    if intent.route in ("search", "images"):
+        query_vector, memory, _ = await asyncio.gather(
+            get_embedding_async(session, question),
+            memory_task,
+            asyncio.to_thread(index_holder.get)
+        )
+    else:
+        memory = await memory_task
+
+    return await asyncio.to_thread(
+        plan_answer, question, group_id, session_id,
+        query_vector=query_vector, memory=memory, intent=intent
+    )
+
+async def generate_answer_async(session, question, context, group_id):
+    key = answer_cache_key(SYSTEM_PROMPT, question, context)
+    answer = await asyncio.to_thread(answer_cache.get, key)
+    if answer is not None:
+        return answer.strip()
+
+    started = time.perf_counter()
+    answer = await call_llama_async(session, SYSTEM_PROMPT, _user_prompt(question, context))
+    await asyncio.to_thread(answer_cache.put, key, group_id, answer, time.perf_counter() - started)
+    return answer.strip()
+
+async def stream_answer_async(session, question, context, group_id):
+    key = answer_cache_key(SYSTEM_PROMPT, question, context)
+    answer = await asyncio.to_thread(answer_cache.get, key)
+    if answer is not None:
+        yield answer.strip()
+        return
+
+    started = time.perf_counter()
+    pieces = []
+    async for piece in stream_llama_async(session, SYSTEM_PROMPT, _user_prompt(question, context)):
+        if not pieces:
+            piece = piece.lstrip()
+            if not piece:
+                continue
+        pieces.append(piece)
+        yield piece
+
+    await asyncio.to_thread(answer_cache.put, key, group_id, "".join(pieces), time.perf_counter() - started)
+
+async def chat_qa_async(session, question, group_id="101", session_id="default", intent=None):
+    plan = await plan_answer_async(session, question, group_id, session_id, intent)
+    if "result" in plan:
+        return plan["result"]
+    return await generate_answer_async(session, question, plan["context"], group_id)
+
+# ---------------------------------------------------------------------------
+# ROUTES
+# ---------------------------------------------------------------------------
+
+routes = web.RouteTableDef()
+
+async def _read_chat_request(request):
+    data = await request.json()
+    question = data.get("question", "")
+    group_id = str(data.get("group_id", "101"))
+    session_id = session_id_for(data, request.headers, request.remote)
+    return question, group_id, session_id, wants_timings(data, request.headers)
+
+def _timings_ms(timings, started):
+    return {**rounded(timings), "total": round((time.perf_counter() - started) * 1000, 3)}
+
+@routes.get("/")
+async def health_check(request):
+    return web.json_response({
+        "status": "running",
+        "message": "IR4U AI Chatbot Server is live",
+        "index": index_stats(),
+        "db_pool": pool_stats(),
+        "memory": memory_stats(),
+        "answer_cache": answer_cache_stats()
+    }, dumps=lambda o: json.dumps(o, default=str))
+
+@routes.get("/welcome")
+async def guest_api(request):
+    return web.json_response({
+        "message": "Welcome to IR4U chatbot"
+    })
+
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+@routes.post("/chat")
+async def chat(request):
+    started = time.perf_counter()
+    route = "unknown"
+    try:
+        question, group_id, session_id, debug = await _read_chat_request(request)
+        intent = classify(question)
+        route = intent.route
+
+        with collect_timings() as timings:
+            result = await chat_qa_async(request.app["http"], question, group_id, session_id, intent)
+
+        if not isinstance(result, dict):
+            result = {"answer": result}
+        result["session_id"] = session_id
+        if debug:
+            result["timings_ms"] = _timings_ms(timings, started)
+        return web.json_response(result, dumps=lambda o: json.dumps(o, default=str))
+
+    except Exception as e:
+        print("SERVER ERROR:", e)
+        REQUEST_ERRORS.inc("/chat")
+        return web.json_response({"answer": "Server error"}, status=500)
+
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat", route)
+
+@routes.post("/chat/stream")
+async def chat_stream(request):
+    """Same event sequence as the Flask /chat/stream route."""
+    started = time.perf_counter()
+    try:
+        question, group_id, session_id, debug = await _read_chat_request(request)
+        intent = classify(question)
+    except Exception as e:
+        # Nothing streamed yet: answer like /chat does
+        print("SERVER ERROR:", e)
+        REQUEST_ERRORS.inc("/chat/stream")
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat/stream", "unknown")
+        return web.json_response({"answer": "Server error"}, status=500)
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+
+    async def send(event, data):
+        await response.write(_sse(event, data).encode("utf-8"))
+
+    with collect_timings() as timings:
+        try:
+            session = request.app["http"]
+            plan = await plan_answer_async(session, question, group_id, session_id, intent)
+
+            if "result" in plan:
+                result = plan["result"]
+                if not isinstance(result, dict):
+                    result = {"answer": result}
+                await send("meta", {"session_id": session_id, "images": result.get("images", [])})
+                await send("token", {"text": result["answer"]})
+            else:
+                await send("meta", {"session_id": session_id, "matches": plan["matches"]})
+                async for piece in stream_answer_async(session, question, plan["context"], group_id):
+                    await send("token", {"text": piece})
+
+            await send("done", {"timings_ms": _timings_ms(timings, started)} if debug else {})
+        except (ConnectionResetError, asyncio.CancelledError):
+            raise   # client went away
+        except Exception as e:
+            print("SERVER ERROR:", e)
+            REQUEST_ERRORS.inc("/chat/stream")
+            await send("error", {"answer": "Server error"})
+
+    REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat/stream", intent.route)
+    await response.write_eof()
+    return response
+
+# ---------------------------------------------------------------------------
+# APP
+# ---------------------------------------------------------------------------
+
+@web.middleware
+async def cors(request, handler):
+    if request.method == "OPTIONS":
+        response = web.Response()
+    else:
+        response = await handler(request)
+
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type, X-Session-Id, X-Debug-Timings"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+async def _resources(app):
+    # One keep-alive pool to the provider and one blocking pool per process
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=AIO_BLOCKING_THREADS))
+
+    app["http"] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=AIO_HTTP_CONNECTIONS),
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+    )
+    yield
+    await app["http"].close()
+
+async def create_app():
+    await asyncio.to_thread(warm_up)
+
+    app = web.Application(middlewares=[cors])
+    app.add_routes(routes)
+    app.cleanup_ctx.append(_resources)
+    return app
+
+if __name__ == "__main__":
+    print(f"🚀 Async AI Chat Server running on port {PORT}")
+    web.run_app(create_app(), host="0.0.0.0", port=PORT)
@@ -0,0 +1,101 @@
+# bench/corpus.py
+# Synthetic chat exports scaled up from cases.json, plus a question
+# workload covering every route of plan_answer.
+import copy
+import json
+import random
+from datetime import datetime, timedelta
+
+MONTHS = ["january", "february", "march", "april", "may", "june",
+          "july", "august", "september", "october", "november", "december"]
+
+def _source_messages(path):
+    with open(path, encoding="utf-8") as f:
+        groups = json.load(f)
+    return [m for g in groups for m in g["data"]]
+
+def _vary(text, rng, vocabulary):
+    # Keep the clinical wording, shuffle a little and borrow a few terms
+    words = text.split()
+    if len(words) > 3:
+        i = rng.randrange(len(words) - 1)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    words += rng.sample(vocabulary, min(2, len(vocabulary)))
+    return " ".join(words)
+
+def build_corpus(out_path, messages=10000, groups=20, source="cases.json", seed=0):
+    """
+    Writes an export shaped like cases.json with `messages` messages over
+    `groups` groups, cycling through the real messages with small text
+    variations and timestamps spread over two years. Returns a summary.
+    """
+    rng = random.Random(seed)
+    source_messages = _source_messages(source)
+    vocabulary = sorted({
+        w.strip(".,;:!?()").lower()
+        for m in source_messages
+        for w in (m.get("message") or "").split()
+        if len(w) > 4
+    })
+
+    per_group = max(1, messages // groups)
+    start = datetime(2024, 1, 1)
+    step = timedelta(days=730) / per_group
+    chat_id = 10_000_000
+    export = []
+
+    for g in range(groups):
+        group_id = str(1000 + g)
+        data = []
+        for i in range(per_group):
+            m = copy.deepcopy(source_messages[(g * 7 + i) % len(source_messages)])
+            chat_id += 1
+            m["chatId"] = chat_id
+            m["groupId"] = group_id
+            m["createdOn"] = (start + step * i).strftime("%Y-%m-%dT%H:%M:%SZ")
+            if m.get("message"):
+                m["message"] = _vary(m["message"], rng, vocabulary)
+            data.append(m)
+
+        export.append({"chatGroupDetails": {"id": int(group_id)}, "data": data, "status": "success"})
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(export, f)
+
+    return {
+        "messages": per_group * groups,
+        "groups": groups,
+        "group_ids": [str(1000 + g) for g in range(groups)],
+        "vocabulary": vocabulary,
+    }
+
+def build_workload(corpus, requests=200, seed=1):
+    """
+    (question, group_id, session_id) tuples: mostly topic questions, plus
+    image, timeline, first-message and follow-up questions.
+    """
+    rng = random.Random(seed)
+    vocabulary = corpus["vocabulary"] or ["stent"]
+    workload = []
+
+    for i in range(requests):
+        group_id = rng.choice(corpus["group_ids"])
+        session_id = f"bench-{i % 50}"
+        roll = rng.random()
+
+        if roll < 0.70:
+            terms = " ".join(rng.sample(vocabulary, min(3, len(vocabulary))))
+            question = f"what was discussed about {terms}?"
+        elif roll < 0.80:
+            question = f"show images of {rng.choice(vocabulary)}"
+        elif roll < 0.88:
+            a, b = sorted(rng.sample(range(12), 2))
+            question = f"summarize {MONTHS[a]} 2024 to {MONTHS[b]} 2024"
+        elif roll < 0.94:
+            question = "who texted first?"
+        else:
+            question = "who replied?"
+
+        workload.append((question, group_id, session_id))
+
+    return workload
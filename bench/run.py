@@ -0,0 +1,287 @@
+# bench/run.py
+# Replays a question workload against main.chat_qa and POST /chat with the
+# provider replaced by bench/stub_server.py and MySQL by bench/sqlite_db.py.
+#
+#   python -m bench.run                                  -> 10k messages, defaults
+#   python -m bench.run --messages 100000 --concurrency 1,8,32 --json out.json
+#   python -m bench.run --json new.json --baseline old.json --max-regression 10
+#
+# Reports end-to-end latency and throughput per concurrency level, and
+# p50/p95/p99 per pipeline stage (embed, index_load, search, hydration,
+# memory, llm) from the spans in metrics.py. The JSON output can be kept per commit and passed back
+# as --baseline to see what a change did.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from bench import sqlite_db, stub_server
+from bench.corpus import build_corpus, build_workload
+
+STAGES = ("embed", "index_load", "search", "hydration", "memory", "llm")
+
+# --------------------------------------------------
+# RUNS
+# --------------------------------------------------
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+            "count": len(values)}
+
+def _summarize(latencies, records, wall_seconds, errors):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": _percentiles(latencies),
+        "stages_ms": {
+            stage: _percentiles([r[stage] for r in records if stage in r])
+            for stage in STAGES
+        },
+    }
+
+def run_chat_qa(chat_qa, collect_timings, workload, concurrency):
+    latencies, records, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(item):
+        nonlocal errors
+        question, group_id, session_id = item
+        started = time.perf_counter()
+        with collect_timings() as stages:
+            try:
+                chat_qa(question, group_id, session_id)
+                failed = False
+            except Exception as e:
+                print("⚠ chat_qa failed:", e)
+                failed = True
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            records.append(stages)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, workload))
+    return _summarize(latencies, records, time.perf_counter() - started, errors)
+
+def run_http(url, workload, concurrency):
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    latencies, records, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(item):
+        nonlocal errors
+        question, group_id, session_id = item
+        started = time.perf_counter()
+        r = session.post(f"{url}/chat", json={
+            "question": question, "group_id": group_id, "session_id": session_id, "debug_timings": True
+        }, timeout=120)
+        failed = r.status_code != 200
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            records.append({} if failed else r.json().get("timings_ms", {}))
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, workload))
+    return _summarize(latencies, records, time.perf_counter() - started, errors)
+
+def reset_caches(vectorstore, models):
+    """Empties the embedding, answer and session caches so every level starts cold."""
+    models._embedding_lru.clear()
+    models.answer_cache._cache.clear()
+    vectorstore.session_memory._cache.clear()
+    with vectorstore.get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM embedding_cache")
+        cur.execute("DELETE FROM answer_cache")
+        conn.commit()
+
+# --------------------------------------------------
+# BASELINE COMPARISON
+# --------------------------------------------------
+def _pct(new, old):
+    return (new - old) / old * 100 if old else 0.0
+
+def compare(result, baseline, max_regression=None):
+    """
+    Prints latency/throughput changes against a previous run; returns
+    the regressions larger than `max_regression` percent.
+    """
+    old_runs = {(r["target"], r["concurrency"]): r for r in baseline["runs"]}
+    regressions = []
+
+    print(f"\nvs baseline {baseline.get('commit') or '?'}:")
+    for run in result["runs"]:
+        old = old_runs.get((run["target"], run["concurrency"]))
+        if old is None or not run["latency_ms"] or not old["latency_ms"]:
+            continue
+
+        changes = {
+            "p50": _pct(run["latency_ms"]["p50"], old["latency_ms"]["p50"]),
+            "p95": _pct(run["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            "p99": _pct(run["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+            "throughput": _pct(run["throughput_rps"], old["throughput_rps"]),
+        }
+        print(f"  {run['target']:8} c={run['concurrency']:<3} " +
+              "  ".join(f"{k} {v:+.1f}%" for k, v in changes.items()))
+
+        if max_regression is not None:
+            if changes["p95"] > max_regression or -changes["throughput"] > max_regression:
+                regressions.append((run["target"], run["concurrency"], changes))
+
+    return regressions
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def _print_run(run):
+    lat = run["latency_ms"]
+    print(f"{run['target']:8} c={run['concurrency']:<3} {run['throughput_rps']:>8} req/s  "
+          f"p50={lat['p50']:.1f}ms  p95={lat['p95']:.1f}ms  p99={lat['p99']:.1f}ms  errors={run['errors']}")
+    for stage in STAGES:
+        s = run["stages_ms"][stage]
+        if s:
+            print(f"{'':14}{stage:11} p50={s['p50']:.2f}ms  p95={s['p95']:.2f}ms  p99={s['p99']:.2f}ms  (n={s['count']})")
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chat_qa and /chat against stub services")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--source", default="cases.json")
+    parser.add_argument("--requests", type=int, default=200, help="questions per concurrency level")
+    parser.add_argument("--concurrency", default="1,4,16,32")
+    parser.add_argument("--targets", default="chat_qa,http")
+    parser.add_argument("--embed-ms", type=float, default=40)
+    parser.add_argument("--llm-ms", type=float, default=600)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--warm-caches", action="store_true", help="keep caches between levels")
+    parser.add_argument("--workdir", help="keep the SQLite db, index files and corpus here")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit 1 if p95 or throughput is worse than the baseline by more than this %%")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ir4u_bench_")
+    os.makedirs(workdir, exist_ok=True)
+
+    config = stub_server.StubConfig(embed_ms=args.embed_ms, llm_ms=args.llm_ms, llm_tokens=args.llm_tokens)
+    stub, stub_url = stub_server.start(config)
+
+    # The app reads its settings at import time, so they go in first
+    os.environ.update({
+        "OPENROUTER_BASE_URL": stub_url,
+        "OPENROUTER_API_KEY": os.getenv("OPENROUTER_API_KEY") or "bench",
+        "EMBED_BACKEND": "remote",
+        "FAISS_INDEX_DIR": os.path.join(workdir, "faiss"),
+    })
+    import models
+    import vectorstore
+    from metrics import collect_timings
+    vectorstore.register_connection_factory(sqlite_db.connection_factory(os.path.join(workdir, "bench.db")))
+
+    corpus_path = os.path.join(workdir, "corpus.json")
+    corpus = build_corpus(corpus_path, args.messages, args.groups, args.source)
+    print(f"📊 Synthetic corpus: {corpus['messages']} messages in {corpus['groups']} groups")
+
+    vectorstore.ensure_schema()
+    started = time.perf_counter()
+    vectorstore.ingest_chat(corpus_path)
+    ingest_seconds = time.perf_counter() - started
+
+    import main as app_main
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class _QuietHandler(WSGIRequestHandler):
+        disable_nagle_algorithm = True
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app = app_main.create_app()
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    app_url = f"http://127.0.0.1:{server.server_port}"
+
+    workload = build_workload(corpus, args.requests)
+    runs = []
+
+    for target in args.targets.split(","):
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            if not args.warm_caches:
+                reset_caches(vectorstore, models)
+
+            if target == "chat_qa":
+                run = run_chat_qa(app_main.chat_qa, collect_timings, workload, concurrency)
+            elif target == "http":
+                run = run_http(app_url, workload, concurrency)
+            else:
+                parser.error(f"unknown target {target!r}")
+
+            run = {"target": target, "concurrency": concurrency, **run}
+            runs.append(run)
+            _print_run(run)
+
+    server.shutdown()
+    stub.shutdown()
+
+    result = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "messages": corpus["messages"],
+            "groups": corpus["groups"],
+            "requests": args.requests,
+            "embed_ms": args.embed_ms,
+            "llm_ms": args.llm_ms,
+            "llm_tokens": args.llm_tokens,
+            "warm_caches": args.warm_caches,
+            "index_type": vectorstore.FAISS_INDEX_TYPE,
+            "hybrid_search": app_main.HYBRID_SEARCH,
+        },
+        "ingest_seconds": round(ingest_seconds, 3),
+        "provider_requests": dict(config.requests),
+        "runs": runs,
+    }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"✔ Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print(f"⚠ {len(regressions)} run(s) regressed by more than {args.max_regression}%")
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
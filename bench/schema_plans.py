@@ -0,0 +1,200 @@
+# bench/schema_plans.py
+# Query plans and timings of the embeddings reads before and after
+# schema versions 10/11 (composite indexes, vectors in embedding_vectors).
+# Builds the version 9 layout with vectors inline, measures, migrates it
+# the way a live deployment would (ensure_schema + migrate_vectors) and
+# measures again.
+#
+#   python -m bench.schema_plans                            -> SQLite stand-in
+#   python -m bench.schema_plans --messages 100000 --json plans.json
+#   python -m bench.schema_plans --mysql                    -> MYSQL_* settings
+#
+# --mysql drops and rebuilds embeddings/embedding_vectors: point it at a
+# scratch database only.
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from bench import sqlite_db, stub_server
+from bench.corpus import build_corpus
+
+LEGACY_VERSION = 9
+
+LEGACY_INSERT_SQL = """
+    INSERT INTO embeddings (
+      faiss_id, chatId, groupId, userName, createdOn, createdOn_dt,
+      text, image_url, image_context, message_type, content_hash, embedding
+    )
+    VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+"""
+
+# (name, SQL, params for a group) of the reads that hit embeddings
+def _queries(group_id, middle_id):
+    return [
+        ("timeline", """
+            SELECT userName, createdOn_dt, text FROM embeddings
+            WHERE groupId = %s AND createdOn_dt BETWEEN %s AND %s
+            ORDER BY createdOn_dt
+        """, (group_id, "2024-03-01 00:00:00", "2024-03-31 23:59:59")),
+        ("first_message", """
+            SELECT faiss_id, userName, createdOn, text FROM embeddings
+            WHERE groupId = %s AND userName != 'system'
+            ORDER BY faiss_id LIMIT 1
+        """, (group_id,)),
+        ("next_message", """
+            SELECT faiss_id, userName, createdOn, text FROM embeddings
+            WHERE groupId = %s AND faiss_id > %s
+            ORDER BY faiss_id LIMIT 1
+        """, (group_id, middle_id)),
+        ("group_users", """
+            SELECT DISTINCT userName FROM embeddings
+            WHERE groupId = %s AND userName != 'system'
+        """, (group_id,)),
+        ("metadata_scan", """
+            SELECT faiss_id, groupId, userName, createdOn, text, image_url, image_context, content_hash
+            FROM embeddings
+            ORDER BY faiss_id
+        """, ()),
+    ]
+
+# --------------------------------------------------
+# LEGACY LAYOUT
+# --------------------------------------------------
+def build_legacy(vectorstore, corpus_path, dim, chunk_size=1000):
+    """Schema version 9 with every vector inline in embeddings.embedding."""
+    with vectorstore.get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS embeddings")
+        cur.execute("DROP TABLE IF EXISTS embedding_vectors")
+
+        for version, migrate in vectorstore.SCHEMA_MIGRATIONS:
+            if version <= LEGACY_VERSION:
+                migrate(cur)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                id INT PRIMARY KEY,
+                version INT NOT NULL,
+                applied_at DATETIME
+            )
+        """)
+        cur.execute("REPLACE INTO schema_version (id, version, applied_at) VALUES (1, %s, NULL)",
+                    (LEGACY_VERSION,))
+
+        rows = []
+        messages = vectorstore._flatten_messages(vectorstore.iter_raw_messages(corpus_path))
+        for fid, m in enumerate(messages):
+            vector = stub_server.embed_text(m["text"] or "", dim)
+            rows.append(vectorstore._message_row(fid, m) + (vectorstore.to_blob(vector),))
+            if len(rows) == chunk_size:
+                cur.executemany(LEGACY_INSERT_SQL, rows)
+                rows = []
+        if rows:
+            cur.executemany(LEGACY_INSERT_SQL, rows)
+        conn.commit()
+
+# --------------------------------------------------
+# MEASURE
+# --------------------------------------------------
+def _plan(cur, sql, params, mysql):
+    if mysql:
+        cur.execute("EXPLAIN " + sql, params)
+        names = [d[0] for d in cur.description]
+        return [
+            " ".join(f"{k}={r[k]}" for k in ("table", "type", "key", "rows", "Extra") if r.get(k) is not None)
+            for r in (dict(zip(names, row)) for row in cur.fetchall())
+        ]
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[-1] for row in cur.fetchall()]
+
+def measure(vectorstore, group_ids, middle_id, repeat, mysql):
+    """{query: {"plan": [...], "median_ms": ...}} over every group."""
+    results = {}
+    with vectorstore.get_conn() as conn:
+        cur = conn.cursor()
+        for name, sql, params in _queries(group_ids[0], middle_id):
+            plan = _plan(cur, sql, params, mysql)
+
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for group_id in (group_ids if params else [None]):
+                    cur.execute(sql, (group_id,) + params[1:] if params else ())
+                    cur.fetchall()
+                runs.append((time.perf_counter() - started) * 1000 / (len(group_ids) if params else 1))
+
+            results[name] = {"plan": plan, "median_ms": round(statistics.median(runs), 3)}
+    return results
+
+def _print(label, results):
+    print(f"\n{label}")
+    for name, r in results.items():
+        print(f"  {name:14} {r['median_ms']:>9.3f} ms")
+        for line in r["plan"]:
+            print(f"  {'':14} {line}")
+
+# --------------------------------------------------
+# MAIN
+# --------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Embeddings query plans before/after the hot/cold schema split")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--source", default="cases.json")
+    parser.add_argument("--dim", type=int, default=384, help="stored vector size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mysql", action="store_true", help="use the MYSQL_* database (scratch only!)")
+    parser.add_argument("--workdir", help="keep the SQLite db and corpus here")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ir4u_plans_")
+    os.makedirs(workdir, exist_ok=True)
+
+    import vectorstore
+    if not args.mysql:
+        vectorstore.register_connection_factory(sqlite_db.connection_factory(os.path.join(workdir, "plans.db")))
+
+    corpus_path = os.path.join(workdir, "corpus.json")
+    corpus = build_corpus(corpus_path, args.messages, args.groups, args.source)
+    print(f"📊 Synthetic corpus: {corpus['messages']} messages in {corpus['groups']} groups")
+
+    build_legacy(vectorstore, corpus_path, args.dim)
+    middle_id = corpus["messages"] // 2
+    before = measure(vectorstore, corpus["group_ids"], middle_id, args.repeat, args.mysql)
+    _print(f"Schema version {LEGACY_VERSION} (vectors inline, no composite indexes):", before)
+
+    started = time.perf_counter()
+    vectorstore.ensure_schema()
+    vectorstore.migrate_vectors(pause=0)
+    migrate_seconds = time.perf_counter() - started
+    if not args.mysql:
+        # InnoDB rebuilds the table when the column is dropped; SQLite only
+        # does so on VACUUM, and would otherwise scan the old blob pages
+        with vectorstore.get_conn() as conn:
+            conn._db.execute("VACUUM")
+
+    after = measure(vectorstore, corpus["group_ids"], middle_id, args.repeat, args.mysql)
+    _print(f"Schema version {vectorstore.SCHEMA_VERSION} (embedding_vectors, composite indexes):", after)
+
+    print("\nchange:")
+    for name in before:
+        old, new = before[name]["median_ms"], after[name]["median_ms"]
+        print(f"  {name:14} {old:>9.3f} -> {new:>9.3f} ms  ({old / new if new else float('inf'):.1f}x)")
+    print(f"  migration took {migrate_seconds:.1f}s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "config": {"messages": corpus["messages"], "groups": corpus["groups"], "dim": args.dim,
+                           "backend": "mysql" if args.mysql else "sqlite"},
+                "migrate_seconds": round(migrate_seconds, 3),
+                "before": before,
+                "after": after,
+            }, f, indent=2)
+        print(f"✔ Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
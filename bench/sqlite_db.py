@@ -0,0 +1,144 @@
+# bench/sqlite_db.py
+# SQLite stand-in for the MySQL tables, speaking just enough of the
+# mysql.connector interface and dialect for vectorstore's queries.
+import re
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float32, float)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(" "))
+
+_REWRITES = [
+    (re.compile(r"UTC_TIMESTAMP\(\)\s*-\s*INTERVAL\s+%s\s+SECOND", re.I), "datetime('now', '-' || %s || ' seconds')"),
+    (re.compile(r"UTC_TIMESTAMP\(\)", re.I), "datetime('now')"),
+    (re.compile(r"INSERT\s+IGNORE", re.I), "INSERT OR IGNORE"),
+    (re.compile(r"SELECT\s+(GET|RELEASE)_LOCK\([^)]*\)", re.I), "SELECT 1"),
+    # Online DDL options; SQLite's ALTER TABLE has no such thing
+    (re.compile(r",\s*(?:ALGORITHM|LOCK)\s*=\s*\w+", re.I), ""),
+    (re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+(?:INDEX|KEY)\s+(\w+)\s*(\([^)]*\))", re.I),
+     r"CREATE INDEX IF NOT EXISTS \2 ON \1 \3"),
+]
+
+# Inline "KEY name (cols)" / "INDEX name (cols)" in CREATE TABLE
+_INLINE_KEY = re.compile(r",\s*(?:UNIQUE\s+)?(?:KEY|INDEX)\s+(\w+)\s*\(([^)]*)\)", re.I)
+_CREATE_TABLE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I)
+_INFO_COLUMNS = re.compile(r"INFORMATION_SCHEMA\.COLUMNS", re.I)
+_INFO_TABLES = re.compile(r"INFORMATION_SCHEMA\.TABLES", re.I)
+_INFO_STATISTICS = re.compile(r"INFORMATION_SCHEMA\.STATISTICS", re.I)
+
+def translate(sql):
+    """MySQL statement -> (SQLite statement, SQLite statements to run after it)."""
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+
+    extra = []
+    table = _CREATE_TABLE.search(sql)
+    if table:
+        for name, cols in _INLINE_KEY.findall(sql):
+            extra.append(f"CREATE INDEX IF NOT EXISTS {name} ON {table.group(1)} ({cols})")
+        sql = _INLINE_KEY.sub("", sql)
+
+    return sql.replace("%s", "?"), extra
+
+class SQLiteCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._cur = conn._db.cursor()
+        self._rows = None
+
+    def execute(self, sql, params=()):
+        self._rows = None
+
+        # Catalog lookups (schema checks) answered from SQLite's own catalog
+        if _INFO_COLUMNS.search(sql):
+            _, table, column = params
+            cols = [r[1] for r in self._conn._db.execute(f"PRAGMA table_info({table})")]
+            self._rows = [(int(column in cols),)]
+            return
+        if _INFO_TABLES.search(sql):
+            _, table = params
+            found = self._conn._db.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (table,)
+            ).fetchone()[0]
+            self._rows = [(found,)]
+            return
+        if _INFO_STATISTICS.search(sql):
+            _, table, index = params
+            names = [r[1] for r in self._conn._db.execute(f"PRAGMA index_list({table})")]
+            self._rows = [(int(index in names),)]
+            return
+
+        sql, extra = translate(sql)
+        self._cur.execute(sql, tuple(params or ()))
+        for statement in extra:
+            self._conn._db.execute(statement)
+
+    def executemany(self, sql, seq):
+        sql, _ = translate(sql)
+        self._cur.executemany(sql, [tuple(p) for p in seq])
+
+    def fetchone(self):
+        if self._rows is not None:
+            return self._rows.pop(0) if self._rows else None
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        if self._rows is not None:
+            rows, self._rows = self._rows, []
+            return rows
+        return self._cur.fetchall()
+
+    def fetchmany(self, size=1):
+        if self._rows is not None:
+            rows, self._rows = self._rows[:size], self._rows[size:]
+            return rows
+        return self._cur.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+class SQLiteConnection:
+    """One SQLite connection dressed up as a mysql.connector connection."""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    @property
+    def in_transaction(self):
+        return self._db.in_transaction
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=False):
+        self._db.execute("SELECT 1")
+
+    def close(self):
+        self._db.close()
+
+def connection_factory(path):
+    """Factory for vectorstore.register_connection_factory."""
+    lock = threading.Lock()
+
+    def connect():
+        with lock:   # WAL setup on a fresh file is not concurrency-safe
+            return SQLiteConnection(path)
+
+    return connect
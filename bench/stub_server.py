@@ -0,0 +1,135 @@
+# bench/stub_server.py
+# Stand-in for the OpenRouter embeddings and chat completions endpoints,
+# with configurable latency. Embeddings are deterministic hashed
+# bag-of-words vectors, so similar texts still land near each other.
+#
+#   python -m bench.stub_server --port 8099 --embed-ms 40 --llm-ms 600
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def embed_text(text, dim=384):
+    vec = np.zeros(dim, dtype="float32")
+    for word in _WORD_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+class StubConfig:
+    def __init__(self, embed_ms=40.0, embed_per_text_ms=0.5, llm_ms=600.0, llm_tokens=40, dim=384):
+        self.embed_ms = embed_ms
+        self.embed_per_text_ms = embed_per_text_ms
+        self.llm_ms = llm_ms
+        self.llm_tokens = llm_tokens
+        self.dim = dim
+        self.requests = {"embeddings": 0, "chat": 0}
+        self.batch_sizes = []              # texts per embeddings request, in arrival order
+        self.failures = []                 # statuses to answer the next requests with
+        self.break_stream_after = None     # drop a streamed completion after this many tokens
+        self.lock = threading.Lock()
+
+def _handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True   # headers and body go out as separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, body):
+            out = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def _fail(self, status):
+            out = json.dumps({"error": {"code": status, "message": "injected failure"}}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            if status in (429, 503):
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(out)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            kind = "embeddings" if self.path.endswith("/embeddings") else "chat"
+
+            with config.lock:
+                config.requests[kind] += 1
+                status = config.failures.pop(0) if config.failures else None
+                if kind == "embeddings" and status is None:
+                    config.batch_sizes.append(len(body["input"]))
+            if status is not None:
+                self._fail(status)
+                return
+
+            if kind == "embeddings":
+                texts = body["input"]
+                time.sleep((config.embed_ms + config.embed_per_text_ms * len(texts)) / 1000)
+                self._json({"data": [
+                    {"index": i, "embedding": embed_text(t, config.dim).tolist()}
+                    for i, t in enumerate(texts)
+                ]})
+                return
+
+            words = [f"word{i}" for i in range(config.llm_tokens)]
+
+            if not body.get("stream"):
+                time.sleep(config.llm_ms / 1000)
+                self._json({"choices": [{"message": {"content": " ".join(words)}}]})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            for i, word in enumerate(words):
+                if i == config.break_stream_after:
+                    self.close_connection = True   # no [DONE], no final chunk
+                    return
+                time.sleep(config.llm_ms / 1000 / len(words))
+                event = {"choices": [{"delta": {"content": word + " "}}]}
+                chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            chunk(b"data: [DONE]\n\n")
+            chunk(b"")
+
+    return Handler
+
+def start(config=None, port=0):
+    """Starts the stub in a daemon thread; returns (server, base_url)."""
+    config = config or StubConfig()
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub embeddings/LLM server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--embed-ms", type=float, default=40)
+    parser.add_argument("--llm-ms", type=float, default=600)
+    args = parser.parse_args()
+
+    server, url = start(StubConfig(embed_ms=args.embed_ms, llm_ms=args.llm_ms), args.port)
+    print(f"Stub provider at {url} (OPENROUTER_BASE_URL={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
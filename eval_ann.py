@@ -0,0 +1,142 @@
+#eval_ann.py
+# Recall and latency of the ANN index types against exact (flat) search,
+# with the same per-group filtering semantic_search does.
+#
+#   python eval_ann.py                          -> vectors stored in MySQL
+#   python eval_ann.py --synthetic 200000       -> random clustered corpus
+#   python eval_ann.py --k 20 --queries 500 --json ann_eval.json
+#
+# Recall@k is the share of the exact top-k (within the query's group) that
+# the ANN index also returns. Use the table to pick FAISS_INDEX_TYPE,
+# FAISS_NPROBE / FAISS_EF_SEARCH and FAISS_ANN_MIN_VECTORS.
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from vectorstore import build_index, search_params, from_blob, get_conn, _normalize, _stored_vectors_sql, INGEST_CHUNK_SIZE
+
+NPROBES = [1, 4, 8, 16, 32, 64, 128]
+EF_SEARCHES = [16, 32, 64, 128, 256]
+
+def load_stored_vectors():
+    """(vectors, ids, group per id) of every stored message."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(_stored_vectors_sql(cur, ", e.groupId"))
+
+        ids, groups, vectors = [], [], []
+        while True:
+            rows = cur.fetchmany(INGEST_CHUNK_SIZE)
+            if not rows:
+                break
+            for fid, group_id, blob in rows:
+                if blob is None:
+                    continue
+                ids.append(fid)
+                groups.append(group_id)
+                vectors.append(from_blob(blob))
+
+    return _normalize(np.array(vectors, dtype="float32")), np.array(ids, dtype="int64"), np.array(groups)
+
+def synthetic_vectors(n, dim=768, groups=20, clusters=200, seed=0):
+    """Clustered random vectors spread over `groups` groups."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype("float32")
+    group_of = rng.integers(0, groups, n).astype(str)
+    return _normalize(vectors), np.arange(n, dtype="int64"), group_of
+
+def _selectors(ids, groups):
+    return {
+        g: faiss.IDSelectorBatch(ids[groups == g])
+        for g in np.unique(groups)
+    }
+
+def _run(index, queries, query_groups, selectors, k, **knobs):
+    """Returns (result ids per query, latency per query in ms)."""
+    found, latencies = [], []
+    for q, g in zip(queries, query_groups):
+        params = search_params(index, selectors[g], **knobs)
+        started = time.perf_counter()
+        _, labels = index.search(q.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(labels[0])
+    return found, np.array(latencies)
+
+def _recall(found, truth):
+    hits = total = 0
+    for got, want in zip(found, truth):
+        want = set(int(i) for i in want if i >= 0)
+        hits += len(want & set(int(i) for i in got))
+        total += len(want)
+    return hits / total if total else 1.0
+
+def evaluate(vectors, ids, groups, k=20, n_queries=500, kinds=("ivf_flat", "hnsw", "ivf_pq"), seed=0):
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(ids), min(n_queries, len(ids)), replace=False)
+    # Perturbed copies of stored messages stand in for questions about them
+    queries = _normalize(vectors[picked] + 0.05 * rng.standard_normal(vectors[picked].shape).astype("float32"))
+    query_groups = groups[picked]
+    selectors = _selectors(ids, groups)
+
+    results = []
+
+    def record(kind, index, build_seconds, knob=None, **knobs):
+        found, latencies = _run(index, queries, query_groups, selectors, k, **knobs)
+        row = {
+            "type": kind,
+            "param": knob,
+            "recall": round(_recall(found, truth), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "build_s": round(build_seconds, 2),
+            "size_mb": round(faiss.serialize_index(index).nbytes / 1e6, 1),
+        }
+        results.append(row)
+        print(f"{row['type']:9} {str(row['param'] or ''):14} recall@{k}={row['recall']:.4f}  "
+              f"p50={row['p50_ms']:.3f}ms  p95={row['p95_ms']:.3f}ms  "
+              f"build={row['build_s']}s  size={row['size_mb']}MB")
+
+    started = time.perf_counter()
+    flat = build_index(vectors, ids, "flat")
+    flat_build = time.perf_counter() - started
+    truth, _ = _run(flat, queries, query_groups, selectors, k)
+    record("flat", flat, flat_build)
+
+    for kind in kinds:
+        started = time.perf_counter()
+        index = build_index(vectors, ids, kind)
+        build_seconds = time.perf_counter() - started
+
+        if kind == "hnsw":
+            for ef in EF_SEARCHES:
+                record(kind, index, build_seconds, f"efSearch={ef}", ef_search=ef)
+        else:
+            nlist = faiss.downcast_index(index.index).nlist
+            for nprobe in [p for p in NPROBES if p <= nlist]:
+                record(kind, index, build_seconds, f"nprobe={nprobe}", nprobe=nprobe)
+
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ANN index settings with exact search")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--types", default="ivf_flat,hnsw,ivf_pq")
+    parser.add_argument("--synthetic", type=int, default=0, help="use N random vectors instead of MySQL")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, ids, groups = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors, ids, groups = load_stored_vectors()
+    print(f"📊 {len(ids)} vectors, dim {vectors.shape[1]}, {len(np.unique(groups))} groups, k={args.k}")
+
+    results = evaluate(vectors, ids, groups, args.k, args.queries, args.types.split(","))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"vectors": len(ids), "k": args.k, "results": results}, f, indent=2)
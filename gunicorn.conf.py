@@ -0,0 +1,26 @@
+# gunicorn.conf.py
+# gunicorn "main:create_app()"
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Processes x threads per process; each thread holds at most one request
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Build the app (schema check + index load) once in the master, then fork
+preload_app = True
+
+# Streamed answers can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+def when_ready(server):
+    # Move everything the master loaded out of the collector's reach so
+    # that collections in the workers don't touch (and copy) those pages
+    gc.freeze()
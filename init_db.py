@@ -1,8 +1,22 @@
 #init_db.py
+import sys
 
-from vectorstore import store_full_chat_data, ingest_chat
+from vectorstore import store_full_chat_data, ingest_chat, ingest_chat_incremental, migrate_vectors
 
-print("📥 Initializing DB and FAISS index...")
-store_full_chat_data("cases.json")
-total = ingest_chat("cases.json")
-print("✔ Done. Indexed", total)
+# python init_db.py                -> full rebuild (drops and re-creates tables)
+# python init_db.py --incremental  -> only add/update/remove what changed
+# python init_db.py --resume       -> continue an interrupted full rebuild
+# python init_db.py --migrate-vectors -> move stored vectors to embedding_vectors, online
+if "--migrate-vectors" in sys.argv:
+    print("📥 Moving vectors to embedding_vectors...")
+    total = migrate_vectors()
+    print("✔ Done. Moved", total)
+elif "--incremental" in sys.argv:
+    print("📥 Applying chat changes to DB and FAISS index...")
+    total = ingest_chat_incremental("cases.json")
+    print("✔ Done. Updated", total)
+else:
+    print("📥 Initializing DB and FAISS index...")
+    store_full_chat_data("cases.json")
+    total = ingest_chat("cases.json", resume="--resume" in sys.argv)
+    print("✔ Done. Indexed", total)
@@ -0,0 +1,220 @@
+# intent.py
+# Single-pass question router. Every phrase and date form is an
+# alternative of one precompiled pattern, so classifying a question is
+# one scan of it, and a new phrase is a new alternative, not a new check.
+import re
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+FIRST_MESSAGE_PHRASES = ["who texted first", "first message"]
+FOLLOW_UP_PHRASES = ["who replied", "what happened next", "continue", "and then"]
+IMAGE_KEYWORDS = [
+    "image", "images", "photo", "photos",
+    "picture", "pictures",
+    "show", "display", "angiogram"
+]
+
+# Checked in this order; "timeline" (any date form) wins over all of them
+_PHRASES = {
+    "first_message": FIRST_MESSAGE_PHRASES,
+    "follow_up": FOLLOW_UP_PHRASES,
+    "images": IMAGE_KEYWORDS,
+}
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+_DAY = r"\d{1,2}(?:st|nd|rd|th)?"
+
+@dataclass(frozen=True)
+class Intent:
+    """What a question asks for. `start`/`end` bound timeline questions."""
+    route: str                  # timeline, first_message, follow_up, images or search
+    start: str = None           # "YYYY-MM-DD HH:MM:SS", inclusive
+    end: str = None
+    matched: str = None         # the part of the question that decided the route
+
+def _term(p, forms=("iso", "dmy", "mdy", "my"), year_required=False):
+    """
+    One date in any of `forms`: 2024-03-05 or 2024-03 (iso), 5 march 2024
+    (dmy), march 5, 2024 (mdy), march 2024 (my) and, without a year,
+    5 march (dm) or march 5 (md). Group names are prefixed with `p` so
+    terms can repeat.
+    """
+    year = rf",?\s+(?P<{p}my_y>\d{{4}})"
+    patterns = {
+        "iso": rf"(?P<{p}iso>\d{{4}}-\d{{2}}(?:-\d{{2}})?)",
+        "dmy": rf"(?P<{p}dmy_d>{_DAY})\s+(?P<{p}dmy_m>{_MONTH})\.?,?\s+(?P<{p}dmy_y>\d{{4}})",
+        "mdy": rf"(?P<{p}mdy_m>{_MONTH})\.?\s+(?P<{p}mdy_d>{_DAY}),?\s+(?P<{p}mdy_y>\d{{4}})",
+        "dm": rf"(?P<{p}dm_d>{_DAY})\s+(?P<{p}dm_m>{_MONTH})\.?",
+        "md": rf"(?P<{p}md_m>{_MONTH})\.?\s+(?P<{p}md_d>{_DAY})",
+        "my": rf"(?P<{p}my_m>{_MONTH})\.?{year if year_required else f'(?:{year})?'}",
+    }
+    return f"(?:{'|'.join(patterns[f] for f in forms)})"
+
+# Either side of a range may leave out what the other side gives ("march 3
+# to 10 march 2024", "from march 1 2024 to march 3"); the year-less day
+# forms go before "my" so "march 3" is not read as all of march. A bare
+# left day ("12 to 15 march 2024") only pairs with a full date.
+_RANGE_SIDE = ("iso", "dmy", "mdy", "dm", "md", "my")
+_SEP = r"\s*(?:to|-|–|through|till|until|and)\s*"
+_RANGE = (rf"(?:\b(?:from|between)\s+)?\b"
+          rf"(?:{_term('a_', _RANGE_SIDE)}{_SEP}{_term('b_', _RANGE_SIDE)}"
+          rf"|(?P<d_a>{_DAY}){_SEP}{_term('d_', ('dmy', 'mdy'))})\b")
+_SINGLE = rf"\b(?:(?:on|in|during)\s+)?{_term('s_', year_required=True)}\b"
+_RELATIVE = (r"\b(?P<rel>today|yesterday|(?P<rel_which>this|last|previous|past)\s+(?P<rel_unit>week|month|year)"
+             r"|(?:last|past)\s+(?P<rel_n>\d{1,3})\s+days)\b")
+
+_pattern = None
+
+def _compile():
+    global _pattern
+    phrases = "|".join(
+        rf"(?P<p_{route}>{'|'.join(re.escape(p) for p in sorted(words, key=len, reverse=True))})"
+        for route, words in _PHRASES.items() if words
+    )
+    # Matches only start at word boundaries, and questions are lower-cased
+    # up front: both cut the work done at each position several-fold
+    _pattern = re.compile(rf"\b(?:(?P<range>{_RANGE})|(?P<single>{_SINGLE})|{_RELATIVE}|{phrases})")
+
+def register_phrases(route, phrases):
+    """
+    Adds phrases that send a question to `route`; like the built-in ones
+    they match at the start of a word. A new route is checked after the
+    existing ones, and plan_answer must know how to handle it.
+    """
+    if not route.isidentifier():
+        raise ValueError(f"Route name must be an identifier: {route!r}")
+    _PHRASES.setdefault(route, [])
+    _PHRASES[route] = _PHRASES[route] + [p.lower() for p in phrases]
+    _compile()
+
+# --------------------------------------------------
+# DATE RESOLUTION
+# --------------------------------------------------
+def _month(name):
+    return _MONTHS[name[:3].lower()]
+
+def _day(text):
+    return int(re.match(r"\d+", text).group())
+
+def _date_parts(m, p):
+    """(year or None, month, day or None) of the term prefixed `p`."""
+    g = m.groupdict()
+    if g.get(p + "iso"):
+        parts = [int(x) for x in g[p + "iso"].split("-")]
+        return parts[0], parts[1], parts[2] if len(parts) > 2 else None
+    for form in ("dmy", "mdy"):
+        if g.get(f"{p}{form}_m"):
+            return int(g[f"{p}{form}_y"]), _month(g[f"{p}{form}_m"]), _day(g[f"{p}{form}_d"])
+    for form in ("dm", "md"):
+        if g.get(f"{p}{form}_m"):
+            return None, _month(g[f"{p}{form}_m"]), _day(g[f"{p}{form}_d"])
+    year = g[p + "my_y"]
+    return (int(year) if year else None), _month(g[p + "my_m"]), None
+
+def _bounds(year, month, day):
+    """First and last second of a day, or of a month when `day` is None."""
+    if day is None:
+        return datetime(year, month, 1), datetime(year, month, monthrange(year, month)[1], 23, 59, 59)
+    return datetime(year, month, day), datetime(year, month, day, 23, 59, 59)
+
+def _day_end(d):
+    return d.replace(hour=23, minute=59, second=59, microsecond=0)
+
+def _relative(m, now):
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    word = m.group("rel").lower()
+
+    if word == "today":
+        return today, _day_end(today)
+    if word == "yesterday":
+        return today - timedelta(days=1), _day_end(today - timedelta(days=1))
+    if m.group("rel_n"):
+        return today - timedelta(days=int(m.group("rel_n"))), _day_end(today)
+
+    which, unit = m.group("rel_which").lower(), m.group("rel_unit").lower()
+    if which == "past":
+        # Rolling window ending today
+        days = {"week": 7, "month": 30, "year": 365}[unit]
+        return today - timedelta(days=days), _day_end(today)
+
+    if unit == "week":
+        start = today - timedelta(days=today.weekday())        # Monday
+        if which == "this":
+            return start, _day_end(today)
+        return start - timedelta(days=7), _day_end(start - timedelta(days=1))
+
+    if unit == "month":
+        start = today.replace(day=1)
+        if which == "this":
+            return start, _day_end(today)
+        last = start - timedelta(days=1)
+        return last.replace(day=1), _day_end(last)
+
+    start = today.replace(month=1, day=1)
+    if which == "this":
+        return start, _day_end(today)
+    return start.replace(year=start.year - 1), _day_end(start - timedelta(days=1))
+
+def _date_range(m, now):
+    """(start, end) datetimes of a date match, or None if it is not a usable date."""
+    try:
+        if m.group("range"):
+            if m.group("d_a"):
+                # "12 to 15 march 2024": both days in the right side's month
+                yb, mb, db = _date_parts(m, "d_")
+                ya, ma, da = yb, mb, _day(m.group("d_a"))
+                if da > db:
+                    return None
+            else:
+                ya, ma, da = _date_parts(m, "a_")
+                yb, mb, db = _date_parts(m, "b_")
+            if ya is None and yb is None:
+                return None
+            if ya is None:
+                # "november to february 2025" starts in 2024
+                ya = yb - 1 if (ma, da or 1) > (mb, db or 31) else yb
+            yb = yb if yb is not None else ya
+            return _bounds(ya, ma, da)[0], _bounds(yb, mb, db)[1]
+        if m.group("single"):
+            return _bounds(*_date_parts(m, "s_"))
+        return _relative(m, now)
+    except ValueError:
+        return None   # 2024-13 or 31 february
+
+# --------------------------------------------------
+# CLASSIFY
+# --------------------------------------------------
+def classify(question: str, now=None) -> Intent:
+    """
+    Routes `question` in one pass over it. A date anywhere makes it a
+    timeline question; otherwise the first route (in _PHRASES order)
+    with a phrase in the question wins, and everything else is a search.
+    Relative dates ("last week") are resolved against `now` (UTC).
+    """
+    found = {}
+    for m in _pattern.finditer(question.lower()):
+        kind = m.lastgroup   # the outermost group: range, single, rel or p_<route>
+
+        if kind in ("range", "single", "rel"):
+            span = _date_range(m, now or datetime.utcnow())
+            if span is None:
+                continue
+            start, end = span
+            return Intent("timeline", start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT), m.group(0))
+
+        found.setdefault(kind[2:], m.group(0))
+
+    for route in _PHRASES:
+        if route in found:
+            return Intent(route, matched=found[route])
+    return Intent("search")
+
+_compile()
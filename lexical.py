@@ -0,0 +1,131 @@
+# lexical.py
+import re
+import math
+from collections import Counter
+import numpy as np
+
+# Words and clinical tokens: "ptbd", "3.5x28mm", "2/3", "clopidogrel"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+# Where compound tokens split: punctuation, and the "x" in sizes like 3.5x28
+_SPLIT_RE = re.compile(r"[./-]|(?<=\d)x(?=\d)")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by did do does for from had has have he her his how i if in
+is it its me my no not of on or our she so that the their them then there they this to
+was we were what when where which who why will with you your
+""".split())
+
+def tokenize(text):
+    """
+    Lower-cased terms of `text`. Compound tokens like "3.5x28mm" are kept
+    whole and also split into their parts, so either form matches.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(str(text or "").lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        parts = _SPLIT_RE.split(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p and p not in STOPWORDS)
+    return terms
+
+class _GroupIndex:
+    """Postings of one group: term -> (doc positions, term frequencies)."""
+
+    def __init__(self, ids, texts):
+        self.ids = np.asarray(ids, dtype="int64")   # ascending faiss_id
+        lengths = np.zeros(len(ids), dtype="float32")
+        postings = {}
+
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[pos] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(pos)
+                postings[term][1].append(tf)
+
+        self.lengths = lengths
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        self.postings = {
+            term: (np.array(pos, dtype="int32"), np.array(tf, dtype="float32"))
+            for term, (pos, tf) in postings.items()
+        }
+
+class BM25Index:
+    """
+    In-memory BM25 over message texts, partitioned by group so a lookup
+    only ever touches that group's postings. Built from the same rows as
+    an index snapshot, so the two always describe the same messages.
+    """
+
+    def __init__(self, docs, k1=1.2, b=0.75):
+        """`docs`: iterable of (faiss_id, group_id, text), in faiss_id order."""
+        self.k1 = k1
+        self.b = b
+
+        by_group = {}
+        for faiss_id, group_id, text in docs:
+            ids, texts = by_group.setdefault(group_id, ([], []))
+            ids.append(faiss_id)
+            texts.append(text)
+
+        self._groups = {g: _GroupIndex(ids, texts) for g, (ids, texts) in by_group.items()}
+
+    def search(self, query, group_id, top_k):
+        """Returns (scores, faiss_ids) of the best `top_k` BM25 matches, best first."""
+        group = self._groups.get(group_id)
+        terms = set(tokenize(query))
+        if group is None or not terms:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+
+        n = len(group.ids)
+        scores = np.zeros(n, dtype="float32")
+        for term in terms:
+            posting = group.postings.get(term)
+            if posting is None:
+                continue
+
+            pos, tf = posting
+            idf = math.log(1 + (n - len(pos) + 0.5) / (len(pos) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * group.lengths[pos] / group.avg_length)
+            scores[pos] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return scores[hits], group.ids[hits]
+
+    def first_match(self, group_id, keyword):
+        """
+        faiss_id of the earliest message in the group containing every
+        term of `keyword`, or None.
+        """
+        group = self._groups.get(group_id)
+        terms = set(tokenize(keyword))
+        if group is None or not terms:
+            return None
+
+        matched = None
+        for term in terms:
+            posting = group.postings.get(term)
+            if posting is None:
+                return None
+            matched = posting[0] if matched is None else np.intersect1d(matched, posting[0], assume_unique=True)
+            if not len(matched):
+                return None
+
+        return int(group.ids[matched.min()])
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked id lists into {id: score}, each list adding 1 / (k + rank).
+    Scores from different retrievers never have to be comparable.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
@@ -1,171 +1,214 @@
 #main.py
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import os
 import re
-from datetime import datetime
-from calendar import monthrange
-from models import call_llama
+import json
+import hashlib
+import time
+import metrics
+from metrics import collect_timings, rounded, REQUEST_SECONDS, REQUEST_ERRORS
+from intent import classify
+from models import call_llama_cached, stream_llama_cached, answer_cache_stats, embedding_cache_stats
 from vectorstore import (
     semantic_search,
+    hybrid_search,
     get_messages_by_date,
+    get_first_message,
+    get_next_message,
     load_memory,
     save_memory,
-    get_conn,
-    ingest_chat,
-    store_full_chat_data
+    index_holder,
+    pool,
+    index_stats,
+    pool_stats,
+    memory_stats,
+    ensure_schema
 )
 
-# CONTEXT BUILDER
-def build_context(rows):
-    return "\n".join(
-        f"{u} ({t}): {txt}" for u, t, txt in rows
-    )
-
-# TIME FILTER EXTRACTION
-def extract_time_filter(question: str):
-    q = question.lower()
+metrics.register_stats("index", index_stats, counters=("loads",))
+metrics.register_stats("db_pool", pool_stats,
+                       counters=("checkouts", "created", "discarded", "timeouts", "wait_seconds_total"))
+metrics.register_stats("memory", memory_stats, counters=("hits", "misses"))
+metrics.register_stats("answer_cache", answer_cache_stats,
+                       counters=("hits", "misses", "durable_hits", "saved_seconds", "invalidations"))
+metrics.register_stats("embedding_cache", embedding_cache_stats,
+                       counters=("durable_hits", "api_requests", "api_texts", "local_texts",
+                                 "memory_hits", "memory_misses"))
 
-    m = re.search(
-        r"(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{4})\s+(to|-)\s+(january|february|march|april|may|june|july|august|september|october|november|december)\s+(\d{4})",
-        q
-    )
+# Load the FAISS index while the app is created (in the gunicorn master
+# with preload_app, so forked workers start with it already mapped)
+PRELOAD_INDEX = os.getenv("PRELOAD_INDEX", "1") == "1"
 
-    if m:
-        return {
-            "start_month": m.group(1),
-            "start_year": int(m.group(2)),
-            "end_month": m.group(4),
-            "end_year": int(m.group(5)),
-        }
+# Fuse BM25 with vector search for text questions (0 = vectors only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
 
-    return None
+# Max prompt tokens spent on retrieved chat lines
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
 
-def resolve_date_range(f):
-    sm = datetime.strptime(f["start_month"].title(), "%B").month
-    em = datetime.strptime(f["end_month"].title(), "%B").month
+# CONTEXT BUILDER
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English with the Llama tokenizer
+    return len(text) // 4 + 1
+
+def _dedupe_key(text) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).split())
+
+def build_context(rows, budget=CONTEXT_TOKEN_BUDGET, scores=None):
+    """
+    Joins (user, time, text) rows into prompt context of at most `budget`
+    tokens. Rows are taken best-first (by `scores` when given, otherwise
+    newest first), near-identical texts are skipped, and the lines that
+    fit are returned in their original order.
+    """
+    if scores is not None:
+        order = sorted(range(len(rows)), key=lambda i: -scores[i])
+    else:
+        order = reversed(range(len(rows)))   # rows arrive oldest first
+
+    kept, seen, used = [], set(), 0
+    for i in order:
+        u, t, txt = rows[i]
+        key = _dedupe_key(txt)
+        if key in seen:
+            continue
+
+        line = f"{u} ({t}): {txt}"
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            if not kept:
+                # A single oversized message still gets in, cut to the budget
+                kept.append((i, line[:budget * 4]))
+            break
+
+        seen.add(key)
+        kept.append((i, line))
+        used += cost
+
+    kept.sort()
+    return "\n".join(line for _, line in kept)
 
-    sy, ey = f["start_year"], f["end_year"]
-    last_day = monthrange(ey, em)[1]
+# LLM ANSWER
+SYSTEM_PROMPT = (
+    "You are an AI assistant designed to extract factual information from group chat messages.\n\n"
+    "RULES:\n"
+    "1. Use ONLY the chat context. Do not guess.\n"
+    "2. Apply the 'not discussed' rule ONLY when the user asks about a topic."
+    "DO NOT apply this rule for date-based summaries.\n"
+    "3. If user asks your opinion → respond: "
+    "\"I am not trained to provide personal opinions or subjective viewpoints.\"\n"
+    "4. If user greets (e.g., 'how are you') → reply neutrally.\n"
+    "5. Keep responses short and factual."
+)
 
-    return (
-        f"{sy}-{sm:02d}-01 00:00:00",
-        f"{ey}-{em:02d}-{last_day} 23:59:59"
-    )
-IMAGE_KEYWORDS = [
-    "image", "images", "photo", "photos",
-    "picture", "pictures",
-    "show", "display", "angiogram"
-]
+def _user_prompt(question: str, context: str):
+    return f"Chat Context:\n{context}\n\nQuestion: {question}"
 
-def is_image_query(question: str) -> bool:
-    q = question.lower()
-    return any(k in q for k in IMAGE_KEYWORDS)
+def generate_answer(question: str, context: str, group_id: str):
+    user_prompt = _user_prompt(question, context)
+    return call_llama_cached(SYSTEM_PROMPT, user_prompt, question, context, group_id).strip()
 
-# LLM ANSWER
-def generate_answer(question: str, context: str):
-    system_prompt = (
-        "You are an AI assistant designed to extract factual information from group chat messages.\n\n"
-        "RULES:\n"
-        "1. Use ONLY the chat context. Do not guess.\n"
-        "2. Apply the 'not discussed' rule ONLY when the user asks about a topic."
-        "DO NOT apply this rule for date-based summaries.\n"
-        "3. If user asks your opinion → respond: "
-        "\"I am not trained to provide personal opinions or subjective viewpoints.\"\n"
-        "4. If user greets (e.g., 'how are you') → reply neutrally.\n"
-        "5. Keep responses short and factual."
-    )
+def stream_answer(question: str, context: str, group_id: str):
+    """Yields the answer in pieces as the LLM produces them."""
+    user_prompt = _user_prompt(question, context)
+    yield from stream_llama_cached(SYSTEM_PROMPT, user_prompt, question, context, group_id)
 
-    user_prompt = f"Chat Context:\n{context}\n\nQuestion: {question}"
-    return call_llama(system_prompt, user_prompt).strip()
+def _match_info(m):
+    return {
+        "faiss_id": m["faiss_id"],
+        "score": round(m["score"], 4),
+        "userName": m["metadata"]["userName"],
+        "createdOn": m["metadata"]["createdOn"],
+        "text": m["metadata"]["text"]
+    }
 
 # MAIN QA LOGIC
-def chat_qa(question: str, group_id="101"):
-    q = question.lower().strip()
-    memory = load_memory()
+def plan_answer(question: str, group_id="101", session_id="default", query_vector=None, memory=None,
+                intent=None):
+    """
+    Runs routing and retrieval. Returns {"result": ...} when the answer is
+    already known, or {"context": ..., "matches": [...]} when the LLM
+    still has to write it. `query_vector`, `memory` and `intent` may be
+    passed in when the caller has already fetched them.
+    """
+    intent = intent or classify(question)
+    route = intent.route
+    if memory is None:
+        memory = load_memory(session_id, group_id)
 
     #  TIMELINE QUERY
-    tf = extract_time_filter(question)
-    if tf:
-        start, end = resolve_date_range(tf)
-        rows = get_messages_by_date(group_id, start, end)
+    if route == "timeline":
+        rows = get_messages_by_date(group_id, intent.start, intent.end)
 
         if not rows:
-            return "No messages were found for the specified time period."
+            return {"result": "No messages were found for the specified time period."}
 
-        context = build_context(rows)
-        return generate_answer(question, context)
+        return {"context": build_context(rows), "matches": []}
 
     #  FIRST MESSAGE
-    if "who texted first" in q or "first message" in q:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT faiss_id, userName, createdOn, text
-            FROM embeddings
-            WHERE groupId=%s AND userName!='system'
-            ORDER BY faiss_id ASC LIMIT 1
-        """, (group_id,))
-        r = cur.fetchone()
-        conn.close()
+    if route == "first_message":
+        r = get_first_message(group_id)
 
         if not r:
-            return "The group has no messages."
+            return {"result": "The group has no messages."}
 
-        save_memory(r[0], r[3], "first_message")
-        return f"{r[1]} sent the first message:\n\"{r[3]}\""
+        save_memory(session_id, group_id, r[0], r[3], "first_message")
+        return {"result": f"{r[1]} sent the first message:\n\"{r[3]}\""}
 
     #  FOLLOW-UPS
-    if any(x in q for x in ["who replied", "what happened next", "continue", "and then"]):
+    if route == "follow_up":
         if memory["last_faiss_id"] is None:
-            return "I don't know which message you are referring to."
-
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT faiss_id, userName, createdOn, text
-            FROM embeddings
-            WHERE faiss_id > %s
-            ORDER BY faiss_id ASC LIMIT 1
-        """, (memory["last_faiss_id"],))
-        r = cur.fetchone()
-        conn.close()
+            return {"result": "I don't know which message you are referring to."}
 
-        if not r:
-            return "There are no more replies after that message."
+        r = get_next_message(group_id, memory["last_faiss_id"])
 
-        save_memory(r[0], r[3], memory["last_topic"])
-        return f"{r[1]} ({r[2]}): {r[3]}"
-
-    matches = semantic_search(question, group_id)
-    if not matches:
-        return "No relevant messages found."
+        if not r:
+            return {"result": "There are no more replies after that message."}
 
-    image_intent = is_image_query(question)
+        save_memory(session_id, group_id, r[0], r[3], memory["last_topic"])
+        return {"result": f"{r[1]} ({r[2]}): {r[3]}"}
 
     #  CASE 1: USER DID NOT ASK FOR IMAGES
-    if not image_intent:
+    if route == "search":
+        search = hybrid_search if HYBRID_SEARCH else semantic_search
+        matches = search(question, group_id, query_vector=query_vector)
+        if not matches:
+            return {"result": "No relevant messages found."}
+
         text_only = [
             m for m in matches
             if not m["metadata"].get("image_url")
         ]
 
         if not text_only:
-            return "The group discussed this topic, but no textual explanation is available."
-
-        context = "\n".join(
-            f'{m["metadata"]["userName"]} ({m["metadata"]["createdOn"]}): {m["metadata"]["text"]}'
-            for m in text_only
+            return {"result": "The group discussed this topic, but no textual explanation is available."}
+
+        context = build_context(
+            [
+                (m["metadata"]["userName"], m["metadata"]["createdOn"], m["metadata"]["text"])
+                for m in text_only
+            ],
+            scores=[m["score"] for m in text_only]
         )
 
         first = text_only[0]
-        save_memory(first["faiss_id"], first["metadata"]["text"], None)
-        return generate_answer(question, context)
+        save_memory(session_id, group_id, first["faiss_id"], first["metadata"]["text"], None)
+        return {"context": context, "matches": [_match_info(m) for m in text_only]}
 
 
     #  CASE 2: USER ASKED FOR IMAGES
     SIMILARITY_THRESHOLD = 0.35   # tune if needed
     TOP_K_IMAGES = 5
 
+    matches = semantic_search(
+        question,
+        group_id,
+        top_k=TOP_K_IMAGES,
+        min_score=SIMILARITY_THRESHOLD,
+        images_only=True,
+        query_vector=query_vector
+    )
+
     images = [
         {
             "url": m["metadata"]["image_url"],
@@ -174,28 +217,27 @@ def chat_qa(question: str, group_id="101"):
             "time": m["metadata"]["createdOn"]
         }
         for m in matches
-        if (
-            m["metadata"].get("image_url")
-            and m["score"] >= SIMILARITY_THRESHOLD
-        )
     ]
 
-    images = images[:TOP_K_IMAGES]
-
     if not images:
-        return {
+        return {"result": {
             "answer": "No relevant images were found for this query.",
             "images": []
-        }
+        }}
 
-    return {
+    return {"result": {
         "answer": "Relevant images from the discussion:",
         "images": images
-    }
+    }}
+
+def chat_qa(question: str, group_id="101", session_id="default", intent=None):
+    plan = plan_answer(question, group_id, session_id, intent=intent)
+    if "result" in plan:
+        return plan["result"]
+    return generate_answer(question, plan["context"], group_id)
 
 # FLASK APP
-app = Flask(__name__)
-CORS(app)
+bp = Blueprint("chat", __name__)
 
 # @app.post("/chat")
 # def chat():
@@ -210,47 +252,163 @@ CORS(app)
 #         print("SERVER ERROR:", e)
 #         return jsonify({"answer": "Server error"}), 500
 
-@app.get("/")
+@bp.get("/")
 def health_check():
     return jsonify({
         "status": "running",
-        "message": "IR4U AI Chatbot Server is live"
+        "message": "IR4U AI Chatbot Server is live",
+        "index": index_stats(),
+        "db_pool": pool_stats(),
+        "memory": memory_stats(),
+        "answer_cache": answer_cache_stats()
     })
 
 
-@app.get("/welcome")
+@bp.get("/welcome")
 def guest_api():
     return jsonify({
         "message": "Welcome to IR4U chatbot"
     })
 
 
-@app.post("/chat")
+@bp.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def wants_timings(data, headers):
+    """Per-request stage breakdown, opted into with "debug_timings" or X-Debug-Timings: 1."""
+    return bool(data.get("debug_timings")) or headers.get("X-Debug-Timings") == "1"
+
+def session_id_for(data, headers, remote_addr):
+    """
+    Follow-up session of a request: "session_id" or X-Session-Id when the
+    client sends one. Clients that don't are keyed by their address and
+    User-Agent, so "who replied" still finds their previous turn.
+    """
+    session_id = data.get("session_id") or headers.get("X-Session-Id")
+    if not session_id:
+        client = headers.get("X-Forwarded-For", "").split(",")[0].strip() or remote_addr or ""
+        digest = hashlib.sha256(f"{client}|{headers.get('User-Agent', '')}".encode("utf-8")).hexdigest()
+        session_id = f"anon-{digest[:32]}"
+    return str(session_id)[:64]
+
+@bp.post("/chat")
 def chat():
+    started = time.perf_counter()
+    route = "unknown"
     try:
         data = request.get_json(force=True)
         question = data.get("question", "")
         group_id = str(data.get("group_id", "101"))
+        intent = classify(question)
+        route = intent.route
+
+        # Follow-ups are tracked per session; the id is echoed for the client to send back
+        session_id = session_id_for(data, request.headers, request.remote_addr)
 
-        result = chat_qa(question, group_id)
+        with collect_timings() as timings:
+            result = chat_qa(question, group_id, session_id, intent)
 
         # result may be string or dict
-        if isinstance(result, dict):
-            return jsonify(result)
-        else:
-            return jsonify({"answer": result})
+        if not isinstance(result, dict):
+            result = {"answer": result}
+        result["session_id"] = session_id
+        if wants_timings(data, request.headers):
+            result["timings_ms"] = {**rounded(timings), "total": round((time.perf_counter() - started) * 1000, 3)}
+        return jsonify(result)
 
     except Exception as e:
         print("SERVER ERROR:", e)
+        REQUEST_ERRORS.inc("/chat")
         return jsonify({"answer": "Server error"}), 500
 
-# START SERVER
-if __name__ == "__main__":
-    print("📥 Loading chat data & generating FAISS index...")
-    store_full_chat_data("cases.json")
-    total = ingest_chat("cases.json")
-    print(f"✔ Indexed {total} messages.")
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat", route)
 
-    print("🚀 Flask AI Chat Server running on port 5000")
-    app.run(host="0.0.0.0", port=5000)
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
+@bp.post("/chat/stream")
+def chat_stream():
+    """
+    Server-sent events: `meta` (session id and matched messages or images)
+    first, then `token` pieces of the answer, then `done`. A request that
+    cannot be read gets the same JSON 500 as /chat.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json(force=True)
+        question = data.get("question", "")
+        group_id = str(data.get("group_id", "101"))
+        session_id = session_id_for(data, request.headers, request.remote_addr)
+        intent = classify(question)
+        debug = wants_timings(data, request.headers)
+    except Exception as e:
+        print("SERVER ERROR:", e)
+        REQUEST_ERRORS.inc("/chat/stream")
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat/stream", "unknown")
+        return jsonify({"answer": "Server error"}), 500
+
+    def events():
+        with collect_timings() as timings:
+            try:
+                plan = plan_answer(question, group_id, session_id, intent=intent)
+
+                if "result" in plan:
+                    result = plan["result"]
+                    if not isinstance(result, dict):
+                        result = {"answer": result}
+                    yield _sse("meta", {"session_id": session_id, "images": result.get("images", [])})
+                    yield _sse("token", {"text": result["answer"]})
+                else:
+                    yield _sse("meta", {"session_id": session_id, "matches": plan["matches"]})
+                    for piece in stream_answer(question, plan["context"], group_id):
+                        yield _sse("token", {"text": piece})
+
+                done = {}
+                if debug:
+                    done["timings_ms"] = {**rounded(timings), "total": round((time.perf_counter() - started) * 1000, 3)}
+                yield _sse("done", done)
+            except Exception as e:
+                print("SERVER ERROR:", e)
+                REQUEST_ERRORS.inc("/chat/stream")
+                yield _sse("error", {"answer": "Server error"})
+
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "/chat/stream", intent.route)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def warm_up():
+    """
+    Schema checks and the index load, done once at startup instead of on
+    the first request. Ingest is not part of startup: run init_db.py.
+    """
+    # Schema checks/migrations run once per process, never per request
+    ensure_schema()
+
+    if PRELOAD_INDEX:
+        try:
+            index_holder.get()
+        except Exception as e:
+            print("⚠ FAISS index not loaded at startup:", e)
+
+    # Workers forked after this must not inherit the master's sockets
+    pool.close_idle()
+
+def create_app():
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(bp)
+    warm_up()
+    return app
+
+# START SERVER
+# Production: gunicorn "main:create_app()"   (settings in gunicorn.conf.py)
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", "5000"))
+    print(f"🚀 Flask AI Chat Server running on port {port}")
+    create_app().run(host="0.0.0.0", port=port)
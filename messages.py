@@ -0,0 +1,128 @@
+# messages.py
+import numpy as np
+from datetime import datetime, timedelta
+
+SYSTEM_USER = "system"
+
+_EPOCH = datetime(1970, 1, 1)
+_NO_TIME = np.iinfo(np.int64).min   # messages without createdOn sort first, match no range
+
+def epoch_seconds(value):
+    """'YYYY-MM-DD HH:MM:SS' / ISO 8601 string or datetime -> UTC epoch seconds."""
+    if isinstance(value, datetime):
+        return int((value - _EPOCH).total_seconds())
+    return int(np.datetime64(str(value).replace("Z", "")[:19], "s").astype("int64"))
+
+def _datetime(ts):
+    return _EPOCH + timedelta(seconds=int(ts))
+
+class _GroupMessages:
+    """
+    One group's messages as columns sorted by (timestamp, faiss_id):
+    ids, epoch seconds, interned user codes and offsets into one UTF-8
+    text buffer. `id_order` visits the rows in faiss_id order.
+    """
+
+    def __init__(self, ids, created, users, texts, system_code):
+        ts = np.array([c[:19] if c else None for c in created], dtype="datetime64[s]").astype("int64")
+        ids = np.asarray(ids, dtype="int64")
+        users = np.asarray(users, dtype="int32")
+        order = np.lexsort((ids, ts))
+
+        self.ids = ids[order]
+        self.ts = ts[order]
+        self.users = users[order]
+
+        encoded = [(texts[i] or "").encode("utf-8") for i in order]
+        self.offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        np.cumsum([len(b) for b in encoded], out=self.offsets[1:])
+        self.text = b"".join(encoded)
+
+        self.id_order = np.argsort(self.ids, kind="stable").astype("int32")
+        self.sorted_ids = self.ids[self.id_order]
+
+        # Earliest message (by faiss_id) that is not a system notice
+        human = np.flatnonzero(self.users[self.id_order] != system_code)
+        self.first_row = int(self.id_order[human[0]]) if len(human) else None
+
+    def text_at(self, row):
+        return self.text[self.offsets[row]:self.offsets[row + 1]].decode("utf-8")
+
+    def nbytes(self):
+        return (self.ids.nbytes + self.ts.nbytes + self.users.nbytes + self.offsets.nbytes
+                + len(self.text) + self.id_order.nbytes + self.sorted_ids.nbytes)
+
+class MessageStore:
+    """
+    Array-backed copy of the messages for timeline and first/next-message
+    questions, partitioned by group. Every lookup is a binary search over
+    one group's columns instead of a SQL round trip. Built from the same
+    rows as an index snapshot, so it refreshes whenever the index does.
+    """
+
+    def __init__(self, rows):
+        """`rows`: iterable of (faiss_id, group_id, userName, createdOn, text)."""
+        self.user_names = []
+        codes = {}
+        by_group = {}
+
+        for faiss_id, group_id, user_name, created_on, text in rows:
+            code = codes.get(user_name)
+            if code is None:
+                code = codes[user_name] = len(self.user_names)
+                self.user_names.append(user_name)
+
+            cols = by_group.setdefault(group_id, ([], [], [], []))
+            cols[0].append(faiss_id)
+            cols[1].append(created_on)
+            cols[2].append(code)
+            cols[3].append(text)
+
+        system_code = codes.get(SYSTEM_USER, -1)
+        self._groups = {g: _GroupMessages(*cols, system_code) for g, cols in by_group.items()}
+        self._system_code = system_code
+
+    def _row(self, group, row):
+        ts = group.ts[row]
+        created_on = None if ts == _NO_TIME else _datetime(ts).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return int(group.ids[row]), self.user_names[group.users[row]], created_on, group.text_at(row)
+
+    def between(self, group_id, start, end):
+        """
+        (userName, createdOn datetime, text) of the group's non-system
+        messages with start <= createdOn <= end, oldest first.
+        """
+        group = self._groups.get(group_id)
+        if group is None:
+            return []
+
+        lo = np.searchsorted(group.ts, epoch_seconds(start), side="left")
+        hi = np.searchsorted(group.ts, epoch_seconds(end), side="right")
+        rows = lo + np.flatnonzero(group.users[lo:hi] != self._system_code)
+        return [(self.user_names[group.users[r]], _datetime(group.ts[r]), group.text_at(r)) for r in rows]
+
+    def first(self, group_id):
+        """(faiss_id, userName, createdOn, text) of the group's first non-system message, or None."""
+        group = self._groups.get(group_id)
+        if group is None or group.first_row is None:
+            return None
+        return self._row(group, group.first_row)
+
+    def next_after(self, group_id, faiss_id):
+        """The group's message right after `faiss_id` (by faiss_id), or None."""
+        group = self._groups.get(group_id)
+        if group is None:
+            return None
+
+        i = np.searchsorted(group.sorted_ids, faiss_id, side="right")
+        if i >= len(group.sorted_ids):
+            return None
+        return self._row(group, group.id_order[i])
+
+    def stats(self):
+        return {
+            "groups": len(self._groups),
+            "messages": sum(len(g.ids) for g in self._groups.values()),
+            "users": len(self.user_names),
+            "bytes": sum(g.nbytes() for g in self._groups.values()),
+        }
@@ -0,0 +1,196 @@
+# metrics.py
+# Stage timings for the request pipeline, exported in the Prometheus text
+# format on /metrics. Metrics are kept per process: under gunicorn each
+# worker reports its own, so scrape them per worker or sum in the query.
+import os
+import time
+import inspect
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+# Histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = tuple(float(b) for b in os.getenv(
+    "METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+).split(","))
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name, help, labels=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+
+        for label_values, values in sorted(series.items()):
+            labels = _labels(self.labels, label_values)
+            sep = "," if labels else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{_braced(labels)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_braced(labels)} {values[-1]}")
+        return lines
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_braced(_labels(self.labels, label_values))} {value}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    return ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+
+def _braced(labels):
+    return f"{{{labels}}}" if labels else ""
+
+STAGE_SECONDS = Histogram("ir4u_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("ir4u_request_seconds", "End-to-end request time.", ("endpoint", "route"))
+REQUEST_ERRORS = Counter("ir4u_request_errors_total", "Requests that failed with a server error.", ("endpoint",))
+
+_METRICS = [STAGE_SECONDS, REQUEST_SECONDS, REQUEST_ERRORS]
+
+# --------------------------------------------------
+# SPANS
+# --------------------------------------------------
+_timings = contextvars.ContextVar("ir4u_timings", default=None)
+
+@contextmanager
+def span(stage):
+    """
+    Times the enclosed block into the stage histogram and, when a request
+    is collecting timings, into its breakdown. Repeated stages add up.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed * 1000
+
+def traced(stage):
+    """Decorator form of span(); generators are timed until exhausted."""
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @wraps(fn)
+            def gen_wrapper(*args, **kwargs):
+                with span(stage):
+                    yield from fn(*args, **kwargs)
+            return gen_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+@contextmanager
+def collect_timings():
+    """
+    Collects this request's stage times: yields a {stage: milliseconds}
+    dict that fills in as spans finish. Work handed to asyncio.to_thread
+    shares the dict; plain worker threads do not.
+    """
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+def rounded(timings):
+    return {stage: round(ms, 3) for stage, ms in timings.items()}
+
+# --------------------------------------------------
+# EXPORT
+# --------------------------------------------------
+_stats_sources = []
+
+def register_stats(prefix, stats_fn, counters=()):
+    """
+    Exports the numeric fields of stats_fn()'s dict as gauges named
+    ir4u_<prefix>_<field> (nested dicts add to the name, e.g. memory_hits).
+    Fields named in `counters` only ever grow and are exported as counters,
+    named with the conventional _total suffix.
+    """
+    _stats_sources.append((prefix, stats_fn, frozenset(counters)))
+
+def _counter_name(name):
+    return name if name.endswith("_total") else f"{name}_total"
+
+def _flatten(stats, prefix=""):
+    """(field, value) of every numeric field, nested names joined with _."""
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{name}_")
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+
+    for prefix, stats_fn, counters in _stats_sources:
+        try:
+            stats = stats_fn()
+        except Exception as e:
+            print(f"⚠ Metrics source {prefix} failed:", e)
+            continue
+        for field, value in _flatten(stats):
+            name = f"ir4u_{prefix}_{field}"
+            if field in counters:
+                name = _counter_name(name)
+                lines.append(f"# TYPE {name} counter")
+            else:
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,18 @@
 # models.py
 import os
+import json
+import hashlib
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
+from cache import LRUCache
+from metrics import traced
 load_dotenv()
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 if not OPENROUTER_API_KEY:
@@ -9,28 +20,99 @@ if not OPENROUTER_API_KEY:
 
 # Chat model
 LLAMA_MODEL = "meta-llama/llama-3.1-8b-instruct"
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Embedding model; every stored vector and cache entry is tied to it
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 
-def get_embedding(text: str):
+# Point at a local stub server for tests/benchmarks
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Where embeddings are computed: "remote" (OpenRouter) or "local" (the same
+# model in-process on CPU; needs `pip install sentence-transformers`)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "remote")
+
+# Local backend: model directory for offline use (default: download
+# EMBED_MODEL once into the Hugging Face cache), torch threads per process,
+# and texts per forward pass
+EMBED_LOCAL_MODEL_PATH = os.getenv("EMBED_LOCAL_MODEL_PATH")
+EMBED_LOCAL_THREADS = int(os.getenv("EMBED_LOCAL_THREADS", "2"))
+EMBED_LOCAL_BATCH_SIZE = int(os.getenv("EMBED_LOCAL_BATCH_SIZE", "32"))
+
+# Embedding batching: texts per request and concurrent requests in flight
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+# Base of the exponential backoff between retries (seconds)
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.5"))
+
+# In-memory tier of the embedding cache (entries)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
     """
-    Generates embeddings using OpenRouter embedding models.
-    Ensures the input is a list (required by OpenRouter).
+    Shared HTTP session: pooled keep-alive connections to the provider,
+    with exponential backoff on 429 and 5xx (honouring Retry-After) and
+    on failed connects. A request that was sent and then timed out is not
+    retried: the provider may still be working on it (and billing it),
+    and a slow completion would otherwise wait out the timeout again.
     """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=HTTP_MAX_RETRIES,
+                    read=False,
+                    other=0,
+                    backoff_factor=HTTP_BACKOFF_SECONDS,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=None,   # POSTs here are safe to repeat
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=max(EMBED_MAX_IN_FLIGHT, 10),
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
 
-    url = "https://openrouter.ai/api/v1/embeddings"
+    return _session
 
-    headers = {
+def auth_headers():
+    """Headers of every provider request, sync or async."""
+    return {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
     }
 
-    # Ensure input is list — required
-    payload = {
+def embedding_payload(texts):
+    """Body of an /embeddings request for `texts`."""
+    return {
         "model": EMBED_MODEL,
-        "input": [text]  
+        "input": list(texts)
     }
 
-    response = requests.post(url, json=payload, headers=headers, timeout=30)
+def parse_embeddings(body, expected):
+    """Vectors of an /embeddings response, in input order; `expected` is the batch size."""
+    data = body["data"]
+    if len(data) != expected:
+        raise ValueError(f"Expected {expected} embeddings, got {len(data)}")
+
+    # Providers may return items out of order; "index" is authoritative
+    data = sorted(data, key=lambda d: d.get("index", 0))
+    return [d["embedding"] for d in data]
+
+def _embed_batch(texts):
+    url = f"{OPENROUTER_BASE_URL}/embeddings"
+
+    response = get_session().post(url, json=embedding_payload(texts), headers=auth_headers(), timeout=30)
 
     # Debug on error
     if response.status_code != 200:
@@ -39,20 +121,256 @@ def get_embedding(text: str):
         print("Response:", response.text)
         response.raise_for_status()
 
-    return response.json()["data"][0]["embedding"]
+    return parse_embeddings(response.json(), len(texts))
 
-def call_llama(system_prompt: str, user_prompt: str):
+def split_batches(texts, batch_size=None):
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with _stats_lock:
+        _embed_stats["api_requests"] += len(batches)
+        _embed_stats["api_texts"] += len(texts)
+    return batches
+
+# --------------------------------------------------
+# EMBEDDERS
+# --------------------------------------------------
+class Embedder(ABC):
     """
-    Calls LLaMA 3.1 (8B-Instruct) using OpenRouter chat endpoint.
+    Turns texts into vectors. Backends that share `model` produce vectors
+    in the same space, so they can be mixed in one index and one cache;
+    `dim` is known once the model is loaded or has answered once.
     """
+    name = None
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    def __init__(self, model=EMBED_MODEL):
+        self.model = model
+        self.dim = None
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    @abstractmethod
+    def embed(self, texts, batch_size=None, max_in_flight=None):
+        """Vectors for `texts`, in order."""
+
+class RemoteEmbedder(Embedder):
+    """EMBED_MODEL behind the OpenRouter embeddings API."""
+    name = "remote"
+
+    def embed(self, texts, batch_size=None, max_in_flight=None):
+        max_in_flight = max_in_flight or EMBED_MAX_IN_FLIGHT
+        batches = split_batches(texts, batch_size)
+
+        if len(batches) == 1:
+            return _embed_batch(batches[0])
+
+        vectors = []
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(batches))) as pool:
+            for batch_vectors in pool.map(_embed_batch, batches):
+                vectors.extend(batch_vectors)
+
+        return vectors
+
+class LocalEmbedder(Embedder):
+    """
+    EMBED_MODEL run in-process with sentence-transformers on CPU. The
+    model is loaded once per process, on first use (so gunicorn workers
+    load it after forking), and torch is pinned to `threads` threads.
+    """
+    name = "local"
+
+    def __init__(self, model=EMBED_MODEL, path=EMBED_LOCAL_MODEL_PATH,
+                 threads=EMBED_LOCAL_THREADS, batch_size=EMBED_LOCAL_BATCH_SIZE):
+        super().__init__(model)
+        self.path = path
+        self.threads = threads
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    import torch
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise RuntimeError(
+                        "EMBED_BACKEND=local needs sentence-transformers: pip install sentence-transformers"
+                    ) from e
+
+                torch.set_num_threads(self.threads)
+                started = time.perf_counter()
+                self._model = SentenceTransformer(self.path or self.model, device="cpu")
+                self.dim = self._model.get_sentence_embedding_dimension()
+                print(f"✔ Loaded {self.model} locally ({self.dim}-d, {time.perf_counter() - started:.1f}s)")
+        return self._model
+
+    def embed(self, texts, batch_size=None, max_in_flight=None):
+        model = self._model or self._load()
+        with _stats_lock:
+            _embed_stats["local_texts"] += len(texts)
+
+        # One forward pass at a time: the pinned threads are the parallelism
+        with self._lock:
+            vectors = model.encode(
+                list(texts),
+                batch_size=batch_size or self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        return list(vectors)
+
+EMBEDDERS = {"remote": RemoteEmbedder, "local": LocalEmbedder}
+
+_embedder = None
+
+def get_embedder():
+    """The process-wide embedder chosen by EMBED_BACKEND."""
+    global _embedder
+
+    if _embedder is None:
+        with _session_lock:
+            if _embedder is None:
+                if EMBED_BACKEND not in EMBEDDERS:
+                    raise ValueError(f"EMBED_BACKEND must be one of {sorted(EMBEDDERS)}, got {EMBED_BACKEND!r}")
+                _embedder = EMBEDDERS[EMBED_BACKEND]()
+
+    return _embedder
+
+def set_embedder(embedder):
+    """Swaps the process-wide embedder (benchmarks, tests, offline tools)."""
+    global _embedder
+    _embedder = embedder
+
+def check_vector_space(model, dim):
+    """
+    Raises if vectors of `model`/`dim` (as recorded with a stored index)
+    can't be compared with what the active embedder produces. A missing
+    model or a not-yet-known dimension is not checked.
+    """
+    embedder = get_embedder()
+    if model and model != embedder.model:
+        raise RuntimeError(
+            f"Index was built with {model} but the embedder is {embedder.model}; "
+            "re-run init_db.py or set EMBED_MODEL back"
+        )
+    if dim and embedder.dim and dim != embedder.dim:
+        raise RuntimeError(f"Index holds {dim}-d vectors but {embedder.model} produces {embedder.dim}-d")
+
+# --------------------------------------------------
+# EMBEDDING CACHE
+# --------------------------------------------------
+_embedding_lru = LRUCache(maxsize=EMBED_CACHE_SIZE)
+_durable_fetch = None
+_durable_store = None
+_stats_lock = threading.Lock()
+_embed_stats = {"durable_hits": 0, "api_requests": 0, "api_texts": 0, "local_texts": 0}
+
+def register_embedding_store(fetch_many, store_many):
+    """
+    Plugs in the durable tier behind the in-memory LRU.
+    fetch_many(keys) -> {key: vector}; store_many([(key, vector), ...]).
+    """
+    global _durable_fetch, _durable_store
+    _durable_fetch, _durable_store = fetch_many, store_many
+
+def normalize_text(text):
+    return " ".join(str(text).split())
+
+def embedding_cache_key(text, model=None):
+    """Content address of an embedding: sha256 of (model, normalized text)."""
+    model = model or get_embedder().model
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def embedding_cache_stats():
+    with _stats_lock:
+        stats = dict(_embed_stats)
+    stats["memory"] = _embedding_lru.stats()
+    stats["backend"] = get_embedder().name
+    return stats
+
+def lookup_embeddings(texts):
+    """
+    Cache half of get_embeddings. Returns (keys, found, to_embed): the
+    cache key per text, vectors already cached, and {key: text} still
+    to be sent to the API (each distinct text once).
+    """
+    texts = [normalize_text(t) for t in texts]
+    keys = [embedding_cache_key(t) for t in texts]
+    found = {}
+
+    for key in dict.fromkeys(keys):
+        vec = _embedding_lru.get(key)
+        if vec is not None:
+            found[key] = vec
+
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+
+    if missing and _durable_fetch is not None:
+        try:
+            durable = _durable_fetch(missing)
+        except Exception as e:
+            print("Embedding cache read failed:", e)
+            durable = {}
+
+        for key, vec in durable.items():
+            _embedding_lru.set(key, vec)
+            found[key] = vec
+
+        with _stats_lock:
+            _embed_stats["durable_hits"] += len(durable)
+
+    to_embed = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            to_embed.setdefault(key, text)
+
+    return keys, found, to_embed
+
+def remember_embeddings(found, to_embed, vectors):
+    """Stores freshly embedded vectors in both cache tiers and in `found`."""
+    embedder = get_embedder()
+    fresh = []
+    for key, vec in zip(to_embed, vectors):
+        vec = np.asarray(vec, dtype=np.float32)
+        if embedder.dim is None:
+            embedder.dim = vec.shape[0]
+        elif vec.shape[0] != embedder.dim:
+            raise ValueError(f"{embedder.model} returned a {vec.shape[0]}-d vector, expected {embedder.dim}-d")
+        vec.flags.writeable = False   # shared through the cache
+        _embedding_lru.set(key, vec)
+        found[key] = vec
+        fresh.append((key, vec))
 
+    if fresh and _durable_store is not None:
+        try:
+            _durable_store(fresh)
+        except Exception as e:
+            print("Embedding cache write failed:", e)
+
+@traced("embed")
+def get_embeddings(texts, batch_size=None, max_in_flight=None):
+    """
+    Embeds many texts, `batch_size` per request with at most
+    `max_in_flight` requests running at once. Order is preserved.
+
+    Lookups go memory LRU -> durable store -> embedding API, and each
+    distinct text is sent to the API at most once.
+    """
+    keys, found, to_embed = lookup_embeddings(texts)
+    if to_embed:
+        vectors = get_embedder().embed(list(to_embed.values()), batch_size, max_in_flight)
+        remember_embeddings(found, to_embed, vectors)
+
+    return [found[key] for key in keys]
+
+def get_embedding(text: str):
+    """
+    Embeds one text with the EMBED_BACKEND embedder (through the
+    embedding cache, like get_embeddings).
+    """
+    return get_embeddings([text])[0]
+
+def chat_payload(system_prompt: str, user_prompt: str, stream=False):
     payload = {
         "model": LLAMA_MODEL,
         "messages": [
@@ -61,8 +379,39 @@ def call_llama(system_prompt: str, user_prompt: str):
         ],
         "temperature": 0.3,
     }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+STREAM_DONE = object()
+
+def parse_stream_line(line):
+    """
+    Content piece carried by one line of a streamed completion, None for
+    lines without content, or STREAM_DONE at the end of the stream.
+    """
+    # Blank keep-alives and ": comment" lines carry no data
+    if not line or not line.startswith("data:"):
+        return None
+
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
 
-    response = requests.post(url, json=payload, headers=headers, timeout=30)
+    choices = json.loads(data).get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
+
+@traced("llm")
+def call_llama(system_prompt: str, user_prompt: str):
+    """
+    Calls LLaMA 3.1 (8B-Instruct) using OpenRouter chat endpoint.
+    """
+
+    url = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+    payload = chat_payload(system_prompt, user_prompt)
+
+    response = get_session().post(url, json=payload, headers=auth_headers(), timeout=30)
 
     if response.status_code != 200:
         print("\nLLaMA API Error:")
@@ -71,3 +420,158 @@ def call_llama(system_prompt: str, user_prompt: str):
         response.raise_for_status()
 
     return response.json()["choices"][0]["message"]["content"]
+
+@traced("llm")
+def stream_llama(system_prompt: str, user_prompt: str):
+    """
+    Streams a LLaMA completion, yielding content pieces as they arrive
+    (OpenAI-style server-sent events from the chat endpoint).
+    """
+
+    url = f"{OPENROUTER_BASE_URL}/chat/completions"
+
+    payload = chat_payload(system_prompt, user_prompt, stream=True)
+
+    with get_session().post(url, json=payload, headers=auth_headers(), timeout=30, stream=True) as response:
+        if response.status_code != 200:
+            print("\nLLaMA API Error:")
+            print("Status:", response.status_code)
+            print("Response:", response.text)
+            response.raise_for_status()
+
+        for line in response.iter_lines(decode_unicode=True):
+            piece = parse_stream_line(line)
+            if piece is STREAM_DONE:
+                break
+            if piece:
+                yield piece
+
+# --------------------------------------------------
+# ANSWER CACHE
+# --------------------------------------------------
+# Same question + same retrieved context -> same answer, so repeat
+# questions skip the LLM. Entries are tagged with their group and dropped
+# when ingest changes that group's data.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+def answer_cache_key(system_prompt, question, context, model=LLAMA_MODEL):
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    raw = "\n".join([model, system_prompt, normalize_text(question).lower(), context_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """
+    LRU+TTL cache of LLM answers with an optional durable tier
+    (see register_answer_store). Tracks hits and the LLM time they saved.
+    Entries carry their group, so invalidating a group filters the cache
+    and nothing outlives the entries the LRU evicts or expires.
+    """
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._durable = None
+        self._stats = {"durable_hits": 0, "saved_seconds": 0.0, "invalidations": 0}
+
+    def register_store(self, fetch, store, delete_group):
+        """fetch(key, ttl) -> (answer, latency, group_id) | None; store(key, group_id, answer, latency); delete_group(group_id)."""
+        self._durable = (fetch, store, delete_group)
+
+    def get(self, key):
+        entry = self._cache.get(key)
+
+        if entry is None and self._durable is not None:
+            try:
+                found = self._durable[0](key, self.ttl)
+            except Exception as e:
+                print("Answer cache read failed:", e)
+                found = None
+            if found is not None:
+                entry = found
+                self._cache.set(key, entry)
+                with self._lock:
+                    self._stats["durable_hits"] += 1
+
+        if entry is None:
+            return None
+
+        answer, latency, _ = entry
+        with self._lock:
+            self._stats["saved_seconds"] += latency
+        return answer
+
+    def put(self, key, group_id, answer, latency):
+        group_id = str(group_id)
+        self._cache.set(key, (answer, latency, group_id))
+
+        if self._durable is not None:
+            try:
+                self._durable[1](key, group_id, answer, latency)
+            except Exception as e:
+                print("Answer cache write failed:", e)
+
+    def invalidate_groups(self, group_ids):
+        group_ids = {str(g) for g in group_ids}
+        self._cache.pop_where(lambda entry: entry[2] in group_ids)
+
+        for group_id in group_ids:
+            with self._lock:
+                self._stats["invalidations"] += 1
+
+            if self._durable is not None:
+                try:
+                    self._durable[2](group_id)
+                except Exception as e:
+                    print("Answer cache invalidation failed:", e)
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update(self._stats)
+        stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+        return stats
+
+answer_cache = AnswerCache()
+
+def call_llama_cached(system_prompt: str, user_prompt: str, question: str, context: str, group_id):
+    """
+    call_llama behind the answer cache, keyed on (model, system prompt,
+    normalized question, hash of context).
+    """
+    key = answer_cache_key(system_prompt, question, context)
+    answer = answer_cache.get(key)
+    if answer is not None:
+        return answer
+
+    started = time.perf_counter()
+    answer = call_llama(system_prompt, user_prompt)
+    answer_cache.put(key, group_id, answer, time.perf_counter() - started)
+    return answer
+
+def stream_llama_cached(system_prompt: str, user_prompt: str, question: str, context: str, group_id):
+    """
+    stream_llama behind the answer cache: a hit is yielded in one piece,
+    a miss is streamed through and cached once complete.
+    """
+    key = answer_cache_key(system_prompt, question, context)
+    answer = answer_cache.get(key)
+    if answer is not None:
+        yield answer.strip()
+        return
+
+    started = time.perf_counter()
+    pieces = []
+    for piece in stream_llama(system_prompt, user_prompt):
+        if not pieces:
+            piece = piece.lstrip()
+            if not piece:
+                continue
+        pieces.append(piece)
+        yield piece
+
+    answer_cache.put(key, group_id, "".join(pieces), time.perf_counter() - started)
+
+def answer_cache_stats():
+    return answer_cache.stats()
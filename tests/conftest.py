@@ -0,0 +1,52 @@
+# tests/conftest.py
+# The app reads its settings at import time, so the stub provider
+# (bench/stub_server.py) and a scratch index directory are set up before
+# any test imports it. MySQL is replaced by the SQLite stand-in.
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import sqlite_db, stub_server
+from bench.corpus import build_corpus
+
+WORKDIR = tempfile.mkdtemp(prefix="ir4u_tests_")
+STUB, STUB_URL = stub_server.start(stub_server.StubConfig(embed_ms=0, embed_per_text_ms=0, llm_ms=5, llm_tokens=8))
+
+os.environ.update({
+    "OPENROUTER_BASE_URL": STUB_URL,
+    "OPENROUTER_API_KEY": "test",
+    "EMBED_BACKEND": "remote",
+    "FAISS_INDEX_DIR": os.path.join(WORKDIR, "faiss"),
+    "HTTP_MAX_RETRIES": "3",
+    "HTTP_BACKOFF_SECONDS": "0.01",
+})
+
+import vectorstore
+
+vectorstore.register_connection_factory(sqlite_db.connection_factory(os.path.join(WORKDIR, "test.db")))
+
+@pytest.fixture
+def stub():
+    """The stub provider's config, with counters and injected faults reset."""
+    config = STUB.config
+    with config.lock:
+        config.requests = {"embeddings": 0, "chat": 0}
+        config.batch_sizes = []
+        config.failures = []
+        config.break_stream_after = None
+    config.llm_ms = 5
+    return config
+
+@pytest.fixture(scope="session")
+def corpus():
+    """A synthetic export ingested into the SQLite stand-in."""
+    path = os.path.join(WORKDIR, "corpus.json")
+    summary = build_corpus(path, messages=600, groups=3, source=os.path.join(ROOT, "cases.json"))
+    vectorstore.ensure_schema()
+    vectorstore.ingest_chat(path)
+    return {**summary, "path": path}
@@ -0,0 +1,49 @@
+# tests/test_aio.py
+import asyncio
+import warnings
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from metrics import REQUEST_ERRORS
+
+def _run(corpus, check):
+    """Runs `check(client)` against a fresh aio_app."""
+    import aio_app
+
+    async def run():
+        async with TestClient(TestServer(await aio_app.create_app())) as client:
+            await check(client)
+
+    asyncio.run(run())
+
+def test_preflight_is_answered_by_the_cors_middleware(corpus):
+    async def check(client):
+        r = await client.options("/chat/stream")
+        assert r.status == 200
+        assert r.headers["Access-Control-Allow-Origin"] == "*"
+        assert "X-Session-Id" in r.headers["Access-Control-Allow-Headers"]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        _run(corpus, check)
+
+def test_stream_with_bad_body_is_a_counted_server_error(corpus):
+    errors = REQUEST_ERRORS._values.get(("/chat/stream",), 0)
+
+    async def check(client):
+        r = await client.post("/chat/stream", data="not json", headers={"Content-Type": "application/json"})
+        assert r.status == 500
+        assert await r.json() == {"answer": "Server error"}
+
+    _run(corpus, check)
+    assert REQUEST_ERRORS._values[("/chat/stream",)] == errors + 1
+
+def test_stream_events(corpus, stub):
+    async def check(client):
+        r = await client.post("/chat/stream", json={"question": "aio stent placement", "group_id": corpus["group_ids"][0]})
+        body = await r.text()
+        names = [line[len("event: "):] for line in body.split("\n") if line.startswith("event: ")]
+        assert names[0] == "meta" and names[-1] == "done"
+        assert set(names[1:-1]) == {"token"}
+
+    _run(corpus, check)
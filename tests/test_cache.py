@@ -0,0 +1,30 @@
+# tests/test_cache.py
+from cache import LRUCache
+from models import AnswerCache
+
+def test_lru_evicts_oldest_and_pops_where():
+    cache = LRUCache(maxsize=3)
+    for i in range(5):
+        cache.set(i, i * 10)
+    assert [cache.get(i) for i in range(5)] == [None, None, 20, 30, 40]
+
+    assert cache.pop_where(lambda v: v >= 30) == 2
+    assert len(cache) == 1 and cache.get(2) == 20
+
+def test_answer_cache_invalidates_only_the_group():
+    cache = AnswerCache(maxsize=10, ttl=60)
+    cache.put("a", 1, "answer a", 0.5)
+    cache.put("b", "2", "answer b", 0.5)
+
+    cache.invalidate_groups(["1"])
+    assert cache.get("a") is None
+    assert cache.get("b") == "answer b"
+
+def test_answer_cache_invalidates_entries_loaded_from_the_durable_tier():
+    durable = {"k": ("stored answer", 1.0, "7")}
+    cache = AnswerCache(maxsize=10, ttl=60)
+    cache.register_store(lambda key, ttl: durable.get(key), lambda *a: None, lambda g: durable.clear())
+
+    assert cache.get("k") == "stored answer"
+    cache.invalidate_groups([7])
+    assert cache.get("k") is None
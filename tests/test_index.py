@@ -0,0 +1,142 @@
+# tests/test_index.py
+import copy
+import json
+import os
+
+import faiss
+import numpy as np
+
+import vectorstore
+
+def _touch(directory, *names):
+    for name in names:
+        open(os.path.join(directory, name), "wb").close()
+
+def test_prune_keeps_newer_generations(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectorstore, "FAISS_INDEX_DIR", str(tmp_path))
+    _touch(tmp_path, "index-100.faiss", "index-200.faiss", "index-300.faiss",
+           "index-300.rebuilt.faiss", "index-400.faiss", "index-500.faiss")
+
+    # Restoring 300 while 400 and 500 were published by other processes
+    vectorstore._prune_index_files(keep=(300,))
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "index-200.faiss", "index-300.faiss", "index-300.rebuilt.faiss", "index-400.faiss", "index-500.faiss",
+    ]
+
+def _vectors(n, dim=32, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def _nearest(index, queries):
+    params = None
+    if vectorstore.index_type(index) in ("ivf_flat", "ivf_pq"):
+        params = faiss.SearchParametersIVF(nprobe=faiss.downcast_index(index.index).nlist)
+    _, found = index.search(queries, 1, params=params)
+    return found[:, 0]
+
+def test_flat_index_keeps_ids_through_removals():
+    x = _vectors(5000)
+    ids = np.arange(1000, 6000)
+    index = vectorstore.build_index(x, ids, "flat")
+
+    edited = np.array([1000, 1001, 1500])
+    index.remove_ids(edited)
+    index.add_with_ids(x[edited - 1000], edited)
+    index.remove_ids(np.array([3000]))
+
+    kept = ids != 3000
+    assert (_nearest(index, x[kept]) == ids[kept]).all()
+    assert 3000 not in _nearest(index, x)
+
+def test_only_flat_indexes_are_patched_in_place():
+    x = _vectors(3000)
+    supports = {kind: vectorstore._supports_remove(vectorstore.build_index(x, np.arange(3000), kind))
+                for kind in ("flat", "ivf_flat", "hnsw")}
+    assert supports == {"flat": True, "ivf_flat": False, "hnsw": False}
+
+def test_incremental_ingest_keeps_ivf_ids(corpus, monkeypatch, tmp_path):
+    monkeypatch.setattr(vectorstore, "FAISS_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setattr(vectorstore, "FAISS_ANN_MIN_VECTORS", 0)
+
+    with open(corpus["path"], encoding="utf-8") as f:
+        export = json.load(f)
+    edited_export = copy.deepcopy(export)
+    edited_export[0]["data"][3]["message"] = "edited: stent exchanged for a larger one"
+    del edited_export[1]["data"][10:20]
+    path = tmp_path / "edited.json"
+    path.write_text(json.dumps(edited_export), encoding="utf-8")
+
+    try:
+        vectorstore.ingest_chat_incremental(str(path))
+        # A second run over the same export patches an IVF index if it is allowed to
+        edited_export[0]["data"][4]["message"] = "edited again: drain removed"
+        path.write_text(json.dumps(edited_export), encoding="utf-8")
+        vectorstore.ingest_chat_incremental(str(path))
+
+        with vectorstore.get_conn() as conn:
+            cur = conn.cursor()
+            index = vectorstore._load_index_for_update(cur)
+            cur.execute(vectorstore._stored_vectors_sql(cur))
+            rows = cur.fetchall()
+
+        assert vectorstore.index_type(index) == "ivf_flat"
+        assert index.ntotal == len(rows)
+        stored = {fid: vectorstore.from_blob(blob) for fid, blob in rows}
+        queries = vectorstore._normalize(np.array(list(stored.values()), dtype="float32"))
+        for (fid, vec), found in zip(stored.items(), _nearest(index, queries)):
+            # Identical texts embed identically, so compare vectors, not ids
+            assert found in stored, (fid, found)
+            assert np.allclose(stored[int(found)], vec), (fid, found)
+    finally:
+        monkeypatch.setattr(vectorstore, "FAISS_INDEX_TYPE", "flat")
+        vectorstore.ingest_chat_incremental(corpus["path"])
+
+def _text_messages(export, group):
+    return [m for m in export[group]["data"] if m.get("messageType") == "message" and m.get("message")]
+
+def _count_loads(monkeypatch):
+    loads = []
+    load = vectorstore._load_index_for_update
+    monkeypatch.setattr(vectorstore, "_load_index_for_update", lambda cur: loads.append(1) or load(cur))
+    return loads
+
+def test_incremental_ingest_loads_the_index_only_to_patch_it(corpus, monkeypatch, tmp_path):
+    loads = _count_loads(monkeypatch)
+    assert vectorstore.ingest_chat_incremental(corpus["path"]) == 0
+    assert loads == []
+
+    with open(corpus["path"], encoding="utf-8") as f:
+        export = json.load(f)
+    _text_messages(export, 2)[0]["message"] = "edited: flat index patched in place"
+    path = tmp_path / "edited.json"
+    path.write_text(json.dumps(export), encoding="utf-8")
+    try:
+        assert vectorstore.ingest_chat_incremental(str(path), chunk_size=1) == 1
+        assert loads == [1]
+    finally:
+        vectorstore.ingest_chat_incremental(corpus["path"])
+
+def test_incremental_ingest_never_loads_an_index_it_rebuilds(corpus, monkeypatch, tmp_path):
+    monkeypatch.setattr(vectorstore, "FAISS_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(vectorstore, "FAISS_ANN_MIN_VECTORS", 0)
+
+    with open(corpus["path"], encoding="utf-8") as f:
+        export = json.load(f)
+    messages = _text_messages(export, 2)
+    path = tmp_path / "edited.json"
+    try:
+        messages[1]["message"] = "edited: hnsw index written"
+        path.write_text(json.dumps(export), encoding="utf-8")
+        vectorstore.ingest_chat_incremental(str(path))
+        assert vectorstore._fetch_index_pointer()["index_type"] == "hnsw"
+
+        loads = _count_loads(monkeypatch)
+        messages[2]["message"] = "edited: hnsw index rebuilt"
+        path.write_text(json.dumps(export), encoding="utf-8")
+        assert vectorstore.ingest_chat_incremental(str(path)) == 1
+        assert loads == []
+        assert vectorstore.index_holder.get().index.ntotal == corpus["messages"]
+    finally:
+        monkeypatch.setattr(vectorstore, "FAISS_INDEX_TYPE", "flat")
+        vectorstore.ingest_chat_incremental(corpus["path"])
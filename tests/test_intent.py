@@ -0,0 +1,90 @@
+# tests/test_intent.py
+import re
+from calendar import monthrange
+from datetime import datetime
+
+import pytest
+
+from bench.corpus import build_workload
+from intent import FIRST_MESSAGE_PHRASES, FOLLOW_UP_PHRASES, IMAGE_KEYWORDS, classify
+
+NOW = datetime(2024, 6, 12, 15, 30)
+
+@pytest.mark.parametrize("question, start, end", [
+    ("between march 3 and march 10 2024", "2024-03-03 00:00:00", "2024-03-10 23:59:59"),
+    ("messages from 12 to 15 march 2024", "2024-03-12 00:00:00", "2024-03-15 23:59:59"),
+    ("from 3 march to 10 march 2024", "2024-03-03 00:00:00", "2024-03-10 23:59:59"),
+    ("from march 1 2024 to march 3", "2024-03-01 00:00:00", "2024-03-03 23:59:59"),
+    ("from 2024-03-01 to 2024-03-05", "2024-03-01 00:00:00", "2024-03-05 23:59:59"),
+    ("november to february 2025", "2024-11-01 00:00:00", "2025-02-28 23:59:59"),
+    ("december 28 to january 3 2025", "2024-12-28 00:00:00", "2025-01-03 23:59:59"),
+    ("what happened in march 2024", "2024-03-01 00:00:00", "2024-03-31 23:59:59"),
+    ("version 2 - march 2024", "2024-03-01 00:00:00", "2024-03-31 23:59:59"),
+    ("on 5th march 2024", "2024-03-05 00:00:00", "2024-03-05 23:59:59"),
+    ("yesterday", "2024-06-11 00:00:00", "2024-06-11 23:59:59"),
+    ("last month", "2024-05-01 00:00:00", "2024-05-31 23:59:59"),
+])
+def test_timeline_ranges(question, start, end):
+    intent = classify(question, now=NOW)
+    assert (intent.route, intent.start, intent.end) == ("timeline", start, end)
+
+@pytest.mark.parametrize("question", [
+    "from 28 to 3 march 2024",   # backwards range
+    "march 3 to march 10",       # no year anywhere
+    "31 february 2024",
+    "what about the stent",
+])
+def test_unusable_dates_fall_back_to_search(question):
+    assert classify(question, now=NOW).route == "search"
+
+@pytest.mark.parametrize("question, route", [
+    ("who texted first", "first_message"),
+    ("who replied", "follow_up"),
+    ("show the angiogram", "images"),
+    ("show the first message", "first_message"),
+    ("show images from march 2024", "timeline"),
+])
+def test_phrase_routes(question, route):
+    assert classify(question, now=NOW).route == route
+
+# The substring chain classify replaced, for the forms it understood
+_LEGACY_MONTH = "(january|february|march|april|may|june|july|august|september|october|november|december)"
+_LEGACY_RANGE = re.compile(rf"{_LEGACY_MONTH}\s+(\d{{4}})\s+(to|-)\s+{_LEGACY_MONTH}\s+(\d{{4}})")
+
+def _legacy(question):
+    q = question.lower().strip()
+    m = _LEGACY_RANGE.search(q)
+    if m:
+        sm = datetime.strptime(m.group(1).title(), "%B").month
+        em = datetime.strptime(m.group(4).title(), "%B").month
+        sy, ey = int(m.group(2)), int(m.group(5))
+        return ("timeline", f"{sy}-{sm:02d}-01 00:00:00", f"{ey}-{em:02d}-{monthrange(ey, em)[1]} 23:59:59")
+    if any(x in q for x in FIRST_MESSAGE_PHRASES):
+        return ("first_message", None, None)
+    if any(x in q for x in FOLLOW_UP_PHRASES):
+        return ("follow_up", None, None)
+    if any(k in q for k in IMAGE_KEYWORDS):
+        return ("images", None, None)
+    return ("search", None, None)
+
+def _workload_questions():
+    corpus = {"vocabulary": ["stent", "ptbd", "biliary", "angioplasty", "drain"], "group_ids": ["1000"]}
+    return sorted({q for q, _, _ in build_workload(corpus, requests=300)})
+
+@pytest.mark.parametrize("question", _workload_questions() + [
+    "march 2024 to june 2024",
+    "What happened between January 2024 - February 2025?",
+    "who texted first in the group",
+    "and then?",
+    "display the angiogram from the case",
+    "how was the stent placed",
+    "continue",
+])
+def test_classify_agrees_with_the_legacy_chain(question):
+    intent = classify(question, now=NOW)
+    assert (intent.route, intent.start, intent.end) == _legacy(question)
+
+def test_phrases_match_at_word_starts_only():
+    # The legacy chain sent this to follow_up through "discontinue"
+    assert _legacy("why discontinue clopidogrel")[0] == "follow_up"
+    assert classify("why discontinue clopidogrel", now=NOW).route == "search"
@@ -0,0 +1,81 @@
+# tests/test_lexical.py
+import json
+import math
+import os
+import random
+from collections import Counter
+
+import pytest
+
+from conftest import ROOT
+from lexical import BM25Index, reciprocal_rank_fusion, tokenize
+
+def _docs():
+    with open(os.path.join(ROOT, "cases.json"), encoding="utf-8") as f:
+        messages = [m for g in json.load(f) for m in g["data"]]
+    # Two groups, so a search must never see the other group's postings
+    return [(fid, str(fid % 2), m.get("message") or "") for fid, m in enumerate(messages)]
+
+def _reference_bm25(docs, query, group_id, k1=1.2, b=0.75):
+    """{faiss_id: score}, scoring each document of the group directly."""
+    group = [(fid, Counter(tokenize(text))) for fid, g, text in docs if g == group_id]
+    avg = sum(sum(c.values()) for _, c in group) / len(group)
+    scores = {}
+    for fid, counts in group:
+        length = sum(counts.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(1 for _, c in group if term in c)
+            tf = counts.get(term, 0)
+            if tf:
+                idf = math.log(1 + (len(group) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg))
+        if score:
+            scores[fid] = score
+    return scores
+
+def test_tokenize_keeps_compounds_and_their_parts():
+    assert tokenize("The 3.5x28mm stent, PTBD done") == ["3.5x28mm", "3", "5", "28mm", "stent", "ptbd", "done"]
+
+@pytest.mark.parametrize("query", ["stent", "biliary drain ptbd", "stent stent placement", "the of and", "zzzz"])
+@pytest.mark.parametrize("group_id", ["0", "1"])
+def test_bm25_matches_reference_scores(query, group_id):
+    docs = _docs()
+    scores, ids = BM25Index(docs).search(query, group_id, top_k=1000)
+    expected = _reference_bm25(docs, query, group_id)
+
+    assert set(ids.tolist()) == set(expected)
+    for score, fid in zip(scores.tolist(), ids.tolist()):
+        assert score == pytest.approx(expected[fid], rel=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+def test_bm25_top_k_is_the_best_k():
+    docs = _docs()
+    index = BM25Index(docs)
+    all_scores, _ = index.search("stent drain", "0", top_k=1000)
+    scores, ids = index.search("stent drain", "0", top_k=3)
+    assert len(ids) == 3
+    assert scores.tolist() == pytest.approx(all_scores[:3].tolist())
+
+def test_bm25_unknown_group_is_empty():
+    scores, ids = BM25Index(_docs()).search("stent", "404", top_k=5)
+    assert len(scores) == len(ids) == 0
+
+def test_first_match_is_the_earliest_message_with_every_term():
+    docs = _docs()
+    index = BM25Index(docs)
+    words = sorted({t for _, _, text in docs for t in tokenize(text)})
+    keywords = random.Random(0).sample(words, 30) + ["stent placement", "3.5x28mm", "zzzz", ""]
+
+    for group_id in ("0", "1", "404"):
+        for keyword in keywords:
+            terms = set(tokenize(keyword))
+            expected = next((fid for fid, g, text in docs
+                             if g == group_id and terms and terms <= set(tokenize(text))), None)
+            assert index.first_match(group_id, keyword) == expected, keyword
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert fused == pytest.approx({1: 1 / 61 + 1 / 62, 2: 1 / 62, 3: 1 / 63 + 1 / 61})
+    assert sorted(fused, key=fused.get, reverse=True) == [1, 3, 2]
+    assert reciprocal_rank_fusion([]) == {}
@@ -0,0 +1,45 @@
+# tests/test_memory.py
+import pytest
+
+import vectorstore
+
+@pytest.fixture(scope="module")
+def client(corpus):
+    import main
+    return main.create_app().test_client()
+
+def _ask(client, question, group_id, **kwargs):
+    return client.post("/chat", json={"question": question, "group_id": group_id}, **kwargs).get_json()
+
+def test_follow_up_without_session_id_finds_the_previous_turn(client, corpus):
+    group_id = corpus["group_ids"][0]
+    first_id = vectorstore.get_first_message(group_id)[0]
+    after = vectorstore.get_next_message(group_id, first_id)
+
+    first = _ask(client, "who texted first", group_id)
+    reply = _ask(client, "who replied", group_id)
+
+    assert reply["session_id"] == first["session_id"]
+    assert reply["answer"] == f"{after[1]} ({after[2]}): {after[3]}"
+
+def test_clients_without_session_id_are_kept_apart(client, corpus):
+    group_id = corpus["group_ids"][1]
+    a = _ask(client, "who texted first", group_id, headers={"User-Agent": "client-a"})
+    b = _ask(client, "who replied", group_id, headers={"User-Agent": "client-b"})
+    c = _ask(client, "who replied", group_id, headers={"User-Agent": "client-b", "X-Forwarded-For": "10.0.0.9"})
+
+    assert len({a["session_id"], b["session_id"], c["session_id"]}) == 3
+    assert b["answer"] == "I don't know which message you are referring to."
+
+def test_explicit_session_id_wins(client, corpus):
+    r = _ask(client, "who texted first", corpus["group_ids"][2], headers={"X-Session-Id": "abc"})
+    assert r["session_id"] == "abc"
+
+def test_schema_drops_the_shared_memory_table(corpus):
+    with vectorstore.get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS conversation_memory (id INT PRIMARY KEY)")
+        conn.commit()
+
+    vectorstore.ensure_schema(force=True)
+    assert not vectorstore._table_exists("conversation_memory")
@@ -0,0 +1,103 @@
+# tests/test_messages.py
+# MessageStore answers the timeline and first/next-message questions that
+# used to be SQL queries; each test runs the old query next to it.
+import os
+import random
+
+import pytest
+
+import vectorstore
+from bench import sqlite_db
+from conftest import WORKDIR
+from messages import MessageStore
+
+BETWEEN_SQL = """
+    SELECT userName, createdOn_dt, text FROM embeddings
+    WHERE groupId=%s AND createdOn_dt BETWEEN %s AND %s AND userName!='system'
+    ORDER BY createdOn_dt ASC, faiss_id ASC
+"""
+FIRST_SQL = """
+    SELECT faiss_id, userName, createdOn, text FROM embeddings
+    WHERE groupId=%s AND userName!='system'
+    ORDER BY faiss_id ASC LIMIT 1
+"""
+NEXT_SQL = """
+    SELECT faiss_id, userName, createdOn, text FROM embeddings
+    WHERE faiss_id > %s AND groupId=%s
+    ORDER BY faiss_id ASC LIMIT 1
+"""
+
+RANGES = [
+    ("2024-01-01 00:00:00", "2024-03-31 23:59:59"),
+    ("2024-02-10 08:00:00", "2024-02-10 08:00:00"),
+    ("2025-06-01 00:00:00", "2025-06-01 23:59:59"),
+    ("2030-01-01 00:00:00", "2030-02-01 00:00:00"),
+]
+
+def _between_rows(rows):
+    return [(user, str(created), text) for user, created, text in rows]
+
+def _fetchone(cur, sql, params):
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    return tuple(row) if row else None
+
+def _compare(cur, group_ids, ids, between, first, next_after):
+    for group_id in group_ids:
+        assert first(group_id) == _fetchone(cur, FIRST_SQL, (group_id,))
+        for faiss_id in ids + [-1, 10 ** 9]:
+            assert next_after(group_id, faiss_id) == _fetchone(cur, NEXT_SQL, (faiss_id, group_id))
+        for start, end in RANGES:
+            cur.execute(BETWEEN_SQL, (group_id, start, end))
+            assert _between_rows(between(group_id, start, end)) == _between_rows(cur.fetchall())
+
+@pytest.fixture(scope="module")
+def edge_rows():
+    """System notices, undated rows, timestamp ties and an empty group, with their SQL table."""
+    rows = [
+        (0, "1", "system", "2024-02-01T09:00:00Z", "group created"),
+        (1, "1", "system", "2024-02-01T09:00:00Z", "alice added"),
+        (2, "1", "alice", None, "no timestamp"),
+        (3, "1", "bob", "2024-02-10T08:00:00Z", "same second, higher id"),
+        (4, "2", "carol", "2024-02-10T08:00:00Z", "other group"),
+        (5, "1", "alice", "2024-02-10T08:00:00Z", "same second again"),
+        (6, "1", "alice", "2024-03-31T23:59:59Z", "last second of march"),
+        (7, "1", "system", "2024-03-05T10:00:00Z", "bob left"),
+        (8, "1", "bob", "2024-04-01T00:00:00Z", "april"),
+        (9, "3", "system", "2024-01-01T00:00:00Z", "only notices"),
+    ]
+    conn = sqlite_db.connection_factory(os.path.join(WORKDIR, "messages.db"))()
+    cur = conn.cursor()
+    cur.execute("DROP TABLE IF EXISTS embeddings")
+    cur.execute("""
+        CREATE TABLE embeddings (
+            faiss_id BIGINT PRIMARY KEY, groupId VARCHAR(64), userName VARCHAR(255),
+            createdOn VARCHAR(64), createdOn_dt DATETIME, text TEXT
+        )
+    """)
+    cur.executemany(
+        "INSERT INTO embeddings (faiss_id, groupId, userName, createdOn, createdOn_dt, text) VALUES (%s,%s,%s,%s,%s,%s)",
+        [(fid, g, u, c, c[:19].replace("T", " ") if c else None, t) for fid, g, u, c, t in rows]
+    )
+    conn.commit()
+    yield MessageStore(rows), cur
+    conn.close()
+
+def test_store_matches_sql_on_edge_rows(edge_rows):
+    store, cur = edge_rows
+    _compare(cur, ["1", "2", "3", "404"], list(range(10)), store.between, store.first, store.next_after)
+
+def test_store_edge_cases(edge_rows):
+    store, _ = edge_rows
+    assert store.first("1") == (2, "alice", None, "no timestamp")
+    assert store.first("3") is None
+    assert store.next_after("1", 1) == (2, "alice", None, "no timestamp")
+    assert [t for _, _, t in store.between("1", "2024-02-10 08:00:00", "2024-03-31 23:59:59")] == [
+        "same second, higher id", "same second again", "last second of march"
+    ]
+
+def test_store_matches_sql_on_corpus(corpus):
+    ids = random.Random(0).sample(range(corpus["messages"]), 50)
+    with vectorstore.get_conn() as conn:
+        _compare(conn.cursor(), corpus["group_ids"] + ["404"], ids, vectorstore.get_messages_by_date,
+                 vectorstore.get_first_message, vectorstore.get_next_message)
@@ -0,0 +1,35 @@
+# tests/test_metrics.py
+import metrics
+
+def test_render_types_counters_and_gauges(monkeypatch):
+    monkeypatch.setattr(metrics, "_stats_sources", [])
+    metrics.register_stats("pool", lambda: {"in_use": 2, "checkouts": 7, "wait_seconds_total": 0.5,
+                                            "memory": {"hits": 3, "size": 1}},
+                           counters=("checkouts", "wait_seconds_total", "memory_hits"))
+    lines = metrics.render().splitlines()
+
+    for name, kind, value in [("ir4u_pool_in_use", "gauge", "2"),
+                              ("ir4u_pool_checkouts_total", "counter", "7"),
+                              ("ir4u_pool_wait_seconds_total", "counter", "0.5"),
+                              ("ir4u_pool_memory_hits_total", "counter", "3"),
+                              ("ir4u_pool_memory_size", "gauge", "1")]:
+        assert f"# TYPE {name} {kind}" in lines
+        assert f"{name} {value}" in lines
+
+    # A _total name is never a gauge
+    gauges = [l.split()[2] for l in lines if l.startswith("# TYPE") and l.endswith(" gauge")]
+    assert not [g for g in gauges if g.endswith("_total")]
+
+def test_app_exports_no_total_gauges(corpus):
+    import main
+    body = main.create_app().test_client().get("/metrics").get_data(as_text=True)
+    assert "# TYPE ir4u_db_pool_wait_seconds_total counter" in body
+    assert not [l for l in body.splitlines() if l.startswith("# TYPE") and "_total gauge" in l]
+
+def test_spans_feed_collected_timings():
+    with metrics.collect_timings() as timings:
+        with metrics.span("search"):
+            pass
+        with metrics.span("search"):
+            pass
+    assert set(timings) == {"search"} and timings["search"] >= 0
@@ -0,0 +1,93 @@
+# tests/test_models.py
+import uuid
+
+import pytest
+import requests
+
+import models
+from bench.stub_server import embed_text
+
+def _texts(n):
+    # Unique per test run, so nothing comes back from the embedding cache
+    run = uuid.uuid4().hex
+    return [f"{run} message {i} about stent placement" for i in range(n)]
+
+def test_retries_429_and_5xx(stub):
+    stub.failures = [429, 503, 502]
+    assert models.call_llama("system", "question")
+    assert stub.requests["chat"] == 4
+
+def test_gives_up_after_max_retries(stub):
+    stub.failures = [503] * (models.HTTP_MAX_RETRIES + 1)
+    with pytest.raises(requests.HTTPError):
+        models.call_llama("system", "question")
+    assert stub.requests["chat"] == models.HTTP_MAX_RETRIES + 1
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_no_retry_on_4xx(stub, status):
+    stub.failures = [status]
+    with pytest.raises(requests.HTTPError):
+        models.call_llama("system", "question")
+    assert stub.requests["chat"] == 1
+
+def test_no_retry_on_read_timeout(stub):
+    stub.llm_ms = 500
+    with pytest.raises(requests.ReadTimeout):
+        models.get_session().post(f"{models.OPENROUTER_BASE_URL}/chat/completions",
+                                  json=models.chat_payload("system", "question"), timeout=0.1)
+    assert stub.requests["chat"] == 1
+
+def test_split_batches():
+    texts = list(range(10))
+    assert models.split_batches(texts, 4) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+    assert models.split_batches(texts, 10) == [texts]
+
+def test_embeddings_are_batched_and_keep_order(stub):
+    texts = _texts(10)
+    vectors = models.get_embeddings(texts, batch_size=4, max_in_flight=3)
+
+    assert sorted(stub.batch_sizes) == [2, 4, 4]
+    for text, vec in zip(texts, vectors):
+        assert vec == pytest.approx(embed_text(models.normalize_text(text), len(vec)), abs=1e-6)
+
+def test_failed_batch_is_retried_alone(stub):
+    stub.failures = [429]
+    vectors = models.get_embeddings(_texts(6), batch_size=3, max_in_flight=1)
+    assert len(vectors) == 6
+    assert stub.requests["embeddings"] == 3
+    assert sorted(stub.batch_sizes) == [3, 3]
+
+def test_repeated_texts_are_embedded_once(stub):
+    text = _texts(1)[0]
+    models.get_embeddings([text, text, f"  {text} "])
+    assert stub.batch_sizes == [1]
+
+def test_async_client_retries_and_timeouts(stub):
+    import asyncio
+    import aiohttp
+    import aio_app
+
+    async def post(session):
+        response = await aio_app._post(session, "/chat/completions", models.chat_payload("system", "question"))
+        response.release()
+        return response.status
+
+    async def run():
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(sock_read=0.1)) as session:
+            stub.failures = [429, 502]
+            assert await post(session) == 200
+            assert stub.requests["chat"] == 3
+
+            stub.llm_ms = 500
+            with pytest.raises(asyncio.TimeoutError):
+                await post(session)
+            assert stub.requests["chat"] == 4
+
+    asyncio.run(run())
+
+def test_embedder_subclass_must_implement_embed():
+    class Broken(models.Embedder):
+        name = "broken"
+
+    with pytest.raises(TypeError):
+        Broken()
@@ -0,0 +1,106 @@
+# tests/test_streaming.py
+import json
+import uuid
+
+import pytest
+import requests
+
+import models
+
+@pytest.fixture(scope="module")
+def client(corpus):
+    import main
+    return main.create_app().test_client()
+
+def _question():
+    # Unique per test, so the answer cache never short-circuits the stream
+    return f"what was discussed about stent placement {uuid.uuid4().hex[:8]}"
+
+def _events(body):
+    """(event, data) pairs of an SSE body, checking each frame's layout."""
+    assert body.endswith("\n\n")
+    events = []
+    for frame in body[:-2].split("\n\n"):
+        lines = frame.split("\n")
+        assert len(lines) == 2, frame
+        assert lines[0].startswith("event: ") and lines[1].startswith("data: "), frame
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+def test_stream_llama_yields_pieces(stub):
+    assert "".join(models.stream_llama("system", "question")).split() == [f"word{i}" for i in range(8)]
+
+def test_stream_llama_raises_when_upstream_breaks(stub):
+    stub.break_stream_after = 3
+    pieces = []
+    with pytest.raises(requests.RequestException):
+        for piece in models.stream_llama("system", "question"):
+            pieces.append(piece)
+    assert "".join(pieces).split() == ["word0", "word1", "word2"]
+
+def test_chat_stream_event_order(client, corpus, stub):
+    r = client.post("/chat/stream", json={"question": _question(), "group_id": corpus["group_ids"][0]})
+
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    assert r.headers["Cache-Control"] == "no-cache"
+
+    events = _events(r.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[0] == "meta" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+
+    meta = events[0][1]
+    assert meta["session_id"] and meta["matches"]
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    assert answer.split() == [f"word{i}" for i in range(8)]
+    assert "timings_ms" not in events[-1][1]
+
+def test_chat_stream_done_carries_timings_on_request(client, corpus, stub):
+    r = client.post("/chat/stream", json={"question": _question(), "group_id": corpus["group_ids"][0]},
+                    headers={"X-Debug-Timings": "1"})
+    name, done = _events(r.get_data(as_text=True))[-1]
+    assert name == "done"
+    assert {"embed", "llm", "total"} <= set(done["timings_ms"])
+
+def test_chat_stream_error_event_when_upstream_breaks(client, corpus, stub):
+    stub.break_stream_after = 3
+    r = client.post("/chat/stream", json={"question": _question(), "group_id": corpus["group_ids"][1]})
+
+    events = _events(r.get_data(as_text=True))
+    assert [name for name, _ in events] == ["meta", "token", "token", "token", "error"]
+    assert events[-1][1] == {"answer": "Server error"}
+
+def test_broken_stream_is_not_cached(client, corpus, stub):
+    question = _question()
+    stub.break_stream_after = 2
+    client.post("/chat/stream", json={"question": question, "group_id": corpus["group_ids"][2]})
+
+    stub.break_stream_after = None
+    events = _events(client.post("/chat/stream", json={"question": question, "group_id": corpus["group_ids"][2]})
+                     .get_data(as_text=True))
+    assert events[-1][0] == "done"
+    assert "".join(d["text"] for n, d in events if n == "token").split() == [f"word{i}" for i in range(8)]
+
+@pytest.mark.parametrize("path", ["/chat", "/chat/stream"])
+def test_question_is_classified_once(client, corpus, stub, monkeypatch, path):
+    import main
+    from intent import classify
+    calls = []
+
+    def counting(question, now=None):
+        calls.append(question)
+        return classify(question, now)
+
+    monkeypatch.setattr(main, "classify", counting)
+    client.post(path, json={"question": _question(), "group_id": corpus["group_ids"][0]}).get_data()
+    assert len(calls) == 1
+
+def test_chat_stream_with_bad_body_is_a_counted_server_error(client):
+    from metrics import REQUEST_ERRORS
+    errors = REQUEST_ERRORS._values.get(("/chat/stream",), 0)
+
+    r = client.post("/chat/stream", data="not json", content_type="application/json")
+    assert r.status_code == 500
+    assert r.get_json() == {"answer": "Server error"}
+    assert REQUEST_ERRORS._values[("/chat/stream",)] == errors + 1
@@ -1,11 +1,30 @@
 # vectorstore.py
 import json
+import hashlib
+import zlib
+import itertools
+import ijson
 import mysql.connector
 import faiss
 import numpy as np
 import os
+import threading
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from models import get_embedding
+from cache import LRUCache
+from metrics import span, traced
+from lexical import BM25Index, reciprocal_rank_fusion
+from messages import MessageStore
+from models import (
+    get_embedding,
+    get_embeddings,
+    register_embedding_store,
+    check_vector_space,
+    answer_cache,
+    EMBED_MODEL
+)
 
 MYSQL_HOST = os.getenv("MYSQL_HOST")
 MYSQL_USER = os.getenv("MYSQL_USER")
@@ -13,9 +32,71 @@ MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE")
 MYSQL_PORT=os.getenv("MYSQL_PORT")
 
+# How often (seconds) a worker checks faiss_index.generation for a newer index
+FAISS_INDEX_REFRESH_SECONDS = float(os.getenv("FAISS_INDEX_REFRESH_SECONDS", "5"))
+
+# Directory of versioned index files (faiss_index only points at one). Ingest
+# and the servers should share it (e.g. one volume); a server that can't see
+# the file rebuilds it once from the stored vectors. Every worker on a host
+# mmaps the same file, so the vectors live once in the page cache.
+FAISS_INDEX_DIR = os.getenv("FAISS_INDEX_DIR", "/tmp/ir4u_faiss")
+FAISS_INDEX_MMAP = os.getenv("FAISS_INDEX_MMAP", "1") == "1"
+
+# Index structure once the corpus reaches FAISS_ANN_MIN_VECTORS: "flat"
+# (exact scan), "ivf_flat", "hnsw" or "ivf_pq". Smaller corpora always use
+# flat. Compare settings on real data with eval_ann.py.
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_ANN_MIN_VECTORS = int(os.getenv("FAISS_ANN_MIN_VECTORS", "50000"))
+
+# IVF: number of lists (0 = 4*sqrt(N)) and lists probed per query
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "32"))
+
+# IVF-PQ: bytes per vector (0 = dim/8; must divide dim)
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "0"))
+
+# HNSW: links per node, and beam width when building / searching
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "128"))
+
+# Messages flowing through ingest at a time (bounds peak memory)
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "256"))
+
+# migrate_vectors: rows moved per transaction, and the pause between them
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "1000"))
+MIGRATE_PAUSE_SECONDS = float(os.getenv("MIGRATE_PAUSE_SECONDS", "0.05"))
+
+# Size of each compressed piece of the raw chat backup
+RAW_BACKUP_CHUNK_BYTES = int(os.getenv("RAW_BACKUP_CHUNK_BYTES", str(1 << 20)))
+
+# Default number of hits semantic_search returns for a group
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "20"))
+
+# Hybrid retrieval: candidates taken from each retriever before fusion, and
+# the reciprocal-rank-fusion constant (higher flattens the rank weighting)
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+
+# Follow-up memory: sessions kept in-process, idle expiry, and optional
+# write-behind persistence to MySQL
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "10000"))
+MEMORY_TTL_SECONDS = float(os.getenv("MEMORY_TTL_SECONDS", "3600"))
+MEMORY_PERSIST = os.getenv("MEMORY_PERSIST", "0") == "1"
+MEMORY_FLUSH_SECONDS = float(os.getenv("MEMORY_FLUSH_SECONDS", "5"))
+
+# Keep LLM answers in MySQL too, shared by all workers and restarts
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "0") == "1"
+
+# Connection pool: max open connections per process, how long a caller waits
+# for one, and how long a connection may sit idle before it is pinged
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "8"))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+MYSQL_POOL_PING_AFTER = float(os.getenv("MYSQL_POOL_PING_AFTER", "30"))
+
 # print("DEBUG MYSQL:", MYSQL_HOST, MYSQL_USER, MYSQL_DATABASE,MYSQL_PORT)
 
-def get_conn():
+def _connect():
     return mysql.connector.connect(
         host=os.getenv("MYSQL_HOST"),
         user=os.getenv("MYSQL_USER"),
@@ -23,9 +104,179 @@ def get_conn():
         database=os.getenv("MYSQL_DATABASE"),
         port=os.getenv("MYSQL_PORT"),
         ssl_ca="ca.pem",
-        ssl_disabled=False
+        ssl_disabled=False,
+        consume_results=True
     )
 
+_connection_factory = _connect
+
+def register_connection_factory(factory):
+    """
+    Replaces how the pool opens connections, e.g. with a local
+    MySQL-compatible stand-in for benchmarks. Call before first use.
+    """
+    global _connection_factory
+    _connection_factory = factory
+
+# --------------------------------------------------
+# CONNECTION POOL
+# --------------------------------------------------
+class PooledConnection:
+    """
+    A checked-out connection. Behaves like the underlying MySQL
+    connection; close() (or leaving a `with` block) hands it back to the
+    pool instead of tearing down the TLS session.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._raw is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+        return False
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections shared by every DB path.
+
+    At most `size` connections are checked out at once; callers beyond
+    that wait up to `timeout` seconds. Connections idle for longer than
+    `ping_after` seconds are pinged (and replaced if dead) on checkout.
+    """
+
+    def __init__(self, size=MYSQL_POOL_SIZE, timeout=MYSQL_POOL_TIMEOUT, ping_after=MYSQL_POOL_PING_AFTER):
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []   # (raw connection, last used at); LIFO keeps warm ones busy
+        self._lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "in_use": 0,
+            "created": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def acquire(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise RuntimeError(f"Timed out after {self.timeout}s waiting for a MySQL connection")
+        waited = time.perf_counter() - started
+
+        try:
+            raw = self._checkout_idle()
+            if raw is None:
+                raw = _connection_factory()
+                with self._lock:
+                    self._stats["created"] += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+        return PooledConnection(self, raw)
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                raw, last_used = self._idle.pop()
+
+            if time.monotonic() - last_used < self.ping_after or self._healthy(raw):
+                return raw
+            self._discard(raw)
+
+    def _healthy(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._stats["discarded"] += 1
+
+    def release(self, raw):
+        try:
+            # Never hand the next caller someone else's open transaction
+            if raw.in_transaction:
+                raw.rollback()
+            with self._lock:
+                self._idle.append((raw, time.monotonic()))
+        except Exception:
+            self._discard(raw)
+        finally:
+            with self._lock:
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def close_idle(self):
+        """
+        Closes every idle connection. Call before forking workers so no two
+        processes end up sharing one socket.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats["size"] = self.size
+        stats["wait_seconds_avg"] = (
+            round(stats["wait_seconds_total"] / stats["checkouts"], 6)
+            if stats["checkouts"] else 0.0
+        )
+        return stats
+
+pool = ConnectionPool()
+
+def get_conn():
+    """
+    Checks a connection out of the shared pool. Use as
+    `with get_conn() as conn:` so it is always returned.
+    """
+    return pool.acquire()
+
+def pool_stats():
+    return pool.stats()
+
 
 # --------------------------------------------------
 # VECTOR HELPERS
@@ -40,132 +291,501 @@ def _normalize(vecs):
     norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-10
     return vecs / norms
 
+# --------------------------------------------------
+# EMBEDDING CACHE (DURABLE TIER)
+# --------------------------------------------------
+def fetch_cached_embeddings(keys, chunk_size=500):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        found = {}
+
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            placeholders = ",".join(["%s"] * len(chunk))
+            cur.execute(
+                f"SELECT cache_key, embedding FROM embedding_cache WHERE cache_key IN ({placeholders})",
+                tuple(chunk)
+            )
+            for key, blob in cur.fetchall():
+                found[key] = from_blob(blob)
+    return found
+
+def store_cached_embeddings(items):
+    if not items:
+        return
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "INSERT IGNORE INTO embedding_cache (cache_key, model, embedding) VALUES (%s, %s, %s)",
+            [(key, EMBED_MODEL, to_blob(vec)) for key, vec in items]
+        )
+        conn.commit()
+
+register_embedding_store(fetch_cached_embeddings, store_cached_embeddings)
+
+# --------------------------------------------------
+# ANSWER CACHE (DURABLE TIER, OPTIONAL)
+# --------------------------------------------------
+def fetch_cached_answer(key, ttl):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT answer, latency_seconds, group_id
+            FROM answer_cache
+            WHERE cache_key=%s AND created_at >= UTC_TIMESTAMP() - INTERVAL %s SECOND
+        """, (key, int(ttl)))
+        r = cur.fetchone()
+    return (r[0], r[1], r[2]) if r else None
+
+def store_cached_answer(key, group_id, answer, latency):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            REPLACE INTO answer_cache (cache_key, group_id, answer, latency_seconds, created_at)
+            VALUES (%s, %s, %s, %s, UTC_TIMESTAMP())
+        """, (key, group_id, answer, latency))
+        conn.commit()
+
+def delete_cached_answers(group_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM answer_cache WHERE group_id=%s", (group_id,))
+        conn.commit()
+
+if ANSWER_CACHE_PERSIST:
+    answer_cache.register_store(fetch_cached_answer, store_cached_answer, delete_cached_answers)
+
 # --------------------------------------------------
 # 🔥 AUTO MIGRATION (NO MANUAL SQL)
 # --------------------------------------------------
-def ensure_createdOn_dt_column():
-    conn = get_conn()
-    cur = conn.cursor()
+# Runs once per process (ensure_schema) and is recorded in schema_version,
+# so request handlers never issue DDL or INFORMATION_SCHEMA lookups.
 
+def _column_exists(cur, table, column):
     cur.execute("""
         SELECT COUNT(*)
         FROM INFORMATION_SCHEMA.COLUMNS
         WHERE TABLE_SCHEMA=%s
-          AND TABLE_NAME='embeddings'
-          AND COLUMN_NAME='createdOn_dt'
-    """, (MYSQL_DATABASE,))
+          AND TABLE_NAME=%s
+          AND COLUMN_NAME=%s
+    """, (MYSQL_DATABASE, table, column))
+    return cur.fetchone()[0] > 0
 
-    exists = cur.fetchone()[0]
+def _index_exists(cur, table, index):
+    cur.execute("""
+        SELECT COUNT(*)
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA=%s
+          AND TABLE_NAME=%s
+          AND INDEX_NAME=%s
+    """, (MYSQL_DATABASE, table, index))
+    return cur.fetchone()[0] > 0
+
+def _table_exists(table):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*)
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s
+        """, (MYSQL_DATABASE, table))
+        exists = cur.fetchone()[0]
+    return bool(exists)
+
+def _migrate_base_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            faiss_id INT PRIMARY KEY,
+            chatId VARCHAR(50),
+            groupId VARCHAR(50),
+            userName VARCHAR(255),
+            createdOn VARCHAR(255),
+            createdOn_dt DATETIME,
+            text TEXT,
+            image_url TEXT,
+            image_context TEXT,
+            message_type VARCHAR(50),
+            content_hash CHAR(64),
+            embedding LONGBLOB
+        )
+    """)
 
-    if not exists:
-        print("🛠 Adding createdOn_dt column...")
-        cur.execute("ALTER TABLE embeddings ADD COLUMN createdOn_dt DATETIME")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS faiss_index (
+            id INT PRIMARY KEY,
+            generation BIGINT NOT NULL,
+            index_data LONGBLOB
+        )
+    """)
 
-        print("🛠 Backfilling createdOn_dt...")
-        cur.execute("""
-            UPDATE embeddings
-            SET createdOn_dt = STR_TO_DATE(
-                REPLACE(REPLACE(createdOn, 'T', ' '), 'Z', ''),
-                '%Y-%m-%d %H:%i:%s'
-            )
-        """)
+    # Checkpoint of a running full ingest
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_progress (
+            id INT PRIMARY KEY,
+            source VARCHAR(512),
+            last_faiss_id INT,
+            status VARCHAR(20),
+            updated_at DATETIME
+        )
+    """)
 
-        conn.commit()
-        print(" createdOn_dt ready")
+    # conversation_memory, the single shared follow-up pointer, used to be
+    # created and seeded here; follow-ups now live in SessionMemoryStore
+    # and migration 12 drops the table from older databases
 
-    conn.close()
+    # Not dropped by init_db: survives re-ingest so unchanged text is never re-embedded
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            model VARCHAR(255),
+            embedding LONGBLOB
+        )
+    """)
+
+def _migrate_createdOn_dt(cur):
+    if _column_exists(cur, "embeddings", "createdOn_dt"):
+        return
 
-# MEMORY TABLE (FOLLOW-UPS)
-def ensure_memory_table():
-    conn = get_conn()
-    cur = conn.cursor()
+    print("🛠 Adding createdOn_dt column...")
+    cur.execute("ALTER TABLE embeddings ADD COLUMN createdOn_dt DATETIME")
 
+    print("🛠 Backfilling createdOn_dt...")
     cur.execute("""
-        CREATE TABLE IF NOT EXISTS conversation_memory (
-            id INT PRIMARY KEY,
+        UPDATE embeddings
+        SET createdOn_dt = STR_TO_DATE(
+            REPLACE(REPLACE(createdOn, 'T', ' '), 'Z', ''),
+            '%Y-%m-%d %H:%i:%s'
+        )
+    """)
+
+def _migrate_content_hash(cur):
+    if _column_exists(cur, "embeddings", "content_hash"):
+        return
+
+    # Left NULL: the next incremental ingest treats those rows as edited
+    # and refreshes them (their vectors come from the embedding cache)
+    print("🛠 Adding content_hash column...")
+    cur.execute("ALTER TABLE embeddings ADD COLUMN content_hash CHAR(64)")
+
+def _migrate_index_generation(cur):
+    if _column_exists(cur, "faiss_index", "generation"):
+        return
+
+    print("🛠 Adding faiss_index.generation column...")
+    cur.execute("ALTER TABLE faiss_index ADD COLUMN generation BIGINT NOT NULL DEFAULT 0")
+
+def _migrate_session_memory(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS session_memory (
+            session_id VARCHAR(64) NOT NULL,
+            group_id VARCHAR(50) NOT NULL,
             last_faiss_id INT NULL,
             last_message_text TEXT NULL,
-            last_topic VARCHAR(255) NULL
+            last_topic VARCHAR(255) NULL,
+            updated_at DATETIME,
+            PRIMARY KEY (session_id, group_id)
         )
     """)
 
-    cur.execute("SELECT COUNT(*) FROM conversation_memory WHERE id=1")
-    if cur.fetchone()[0] == 0:
-        cur.execute("""
-            INSERT INTO conversation_memory
-            VALUES (1, NULL, NULL, NULL)
-        """)
+def _migrate_answer_cache(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            group_id VARCHAR(50),
+            answer MEDIUMTEXT,
+            latency_seconds FLOAT,
+            created_at DATETIME,
+            KEY idx_answer_cache_group (group_id)
+        )
+    """)
 
-    conn.commit()
-    conn.close()
+def _migrate_index_file(cur):
+    # The index moves to a file; the row keeps its name and checksum.
+    # index_data stays for rows written before this, and is NULL after.
+    for column, ddl in [
+        ("file_name", "VARCHAR(255) NULL"),
+        ("checksum", "CHAR(64) NULL"),
+        ("nbytes", "BIGINT NULL"),
+        ("ntotal", "BIGINT NULL"),
+    ]:
+        if not _column_exists(cur, "faiss_index", column):
+            print(f"🛠 Adding faiss_index.{column} column...")
+            cur.execute(f"ALTER TABLE faiss_index ADD COLUMN {column} {ddl}")
+
+def _migrate_index_type(cur):
+    # Readers pick mmap flags by type before opening the file
+    if _column_exists(cur, "faiss_index", "index_type"):
+        return
+
+    print("🛠 Adding faiss_index.index_type column...")
+    cur.execute("ALTER TABLE faiss_index ADD COLUMN index_type VARCHAR(20) NULL")
 
-def load_memory():
-    ensure_memory_table()
-    conn = get_conn()
-    cur = conn.cursor()
+def _migrate_index_embed_model(cur):
+    # Which embedding model the index's vectors came from (NULL: not recorded)
+    if _column_exists(cur, "faiss_index", "embed_model"):
+        return
 
+    print("🛠 Adding faiss_index.embed_model column...")
+    cur.execute("ALTER TABLE faiss_index ADD COLUMN embed_model VARCHAR(255) NULL")
+
+# Per-group reads: timeline ranges, first/next message, group members
+EMBEDDING_INDEXES = [
+    ("idx_embeddings_group_time", "groupId, createdOn_dt"),
+    ("idx_embeddings_group_id", "groupId, faiss_id"),
+    ("idx_embeddings_group_user", "groupId, userName"),
+]
+
+def _migrate_embedding_indexes(cur):
+    # Built in place without locking the table, so serving carries on
+    for name, columns in EMBEDDING_INDEXES:
+        if not _index_exists(cur, "embeddings", name):
+            print(f"🛠 Adding index {name} ({columns})...")
+            cur.execute(f"ALTER TABLE embeddings ADD INDEX {name} ({columns}), ALGORITHM=INPLACE, LOCK=NONE")
+
+def _migrate_embedding_vectors(cur):
+    # Vectors get their own (cold) table so metadata reads stop dragging a
+    # LONGBLOB per row. Only the table is created here: a deployment with
+    # data moves its vectors with migrate_vectors(), batched and online.
     cur.execute("""
-        SELECT last_faiss_id, last_message_text, last_topic
-        FROM conversation_memory WHERE id=1
+        CREATE TABLE IF NOT EXISTS embedding_vectors (
+            faiss_id INT PRIMARY KEY,
+            embedding LONGBLOB NOT NULL
+        )
     """)
 
-    r = cur.fetchone()
-    conn.close()
+    if _column_exists(cur, "embeddings", "embedding"):
+        cur.execute("SELECT faiss_id FROM embeddings LIMIT 1")
+        if cur.fetchone() is None:
+            cur.execute("ALTER TABLE embeddings DROP COLUMN embedding")   # nothing to move
+        else:
+            print("⚠ Vectors are still in embeddings.embedding; run: python init_db.py --migrate-vectors")
+
+def _migrate_drop_conversation_memory(cur):
+    cur.execute("DROP TABLE IF EXISTS conversation_memory")
+
+# (version, migration) — append only; every step must be safe to re-run
+SCHEMA_MIGRATIONS = [
+    (1, _migrate_base_tables),
+    (2, _migrate_createdOn_dt),
+    (3, _migrate_content_hash),
+    (4, _migrate_index_generation),
+    (5, _migrate_session_memory),
+    (6, _migrate_answer_cache),
+    (7, _migrate_index_file),
+    (8, _migrate_index_type),
+    (9, _migrate_index_embed_model),
+    (10, _migrate_embedding_indexes),
+    (11, _migrate_embedding_vectors),
+    (12, _migrate_drop_conversation_memory),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def ensure_schema(force=False):
+    """
+    Brings the database up to SCHEMA_VERSION. After the first call in a
+    process this is a no-op; `force` re-applies every step (used after
+    init_db drops tables).
+    """
+    global _schema_ready
 
-    return {
-        "last_faiss_id": r[0],
-        "last_message_text": r[1],
-        "last_topic": r[2]
-    }
+    if _schema_ready and not force:
+        return
 
-def save_memory(last_faiss_id=None, last_message_text=None, last_topic=None):
-    ensure_memory_table()
-    conn = get_conn()
-    cur = conn.cursor()
+    with _schema_lock:
+        if _schema_ready and not force:
+            return
+
+        with get_conn() as conn:
+            cur = conn.cursor()
+
+            # Serialise migrations across workers/processes
+            cur.execute("SELECT GET_LOCK('ir4u_schema', 60)")
+            cur.fetchone()
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        id INT PRIMARY KEY,
+                        version INT NOT NULL,
+                        applied_at DATETIME
+                    )
+                """)
+                cur.execute("SELECT version FROM schema_version WHERE id=1")
+                row = cur.fetchone()
+                current = 0 if force or not row else row[0]
+
+                for version, migrate in SCHEMA_MIGRATIONS:
+                    if version > current:
+                        migrate(cur)
+                        cur.execute(
+                            "REPLACE INTO schema_version (id, version, applied_at) VALUES (1, %s, %s)",
+                            (version, datetime.utcnow())
+                        )
+                        conn.commit()
+
+                if current < SCHEMA_VERSION:
+                    print(f"✔ Schema at version {SCHEMA_VERSION}")
+            finally:
+                cur.execute("SELECT RELEASE_LOCK('ir4u_schema')")
+                cur.fetchone()
+
+        _schema_ready = True
 
-    cur.execute("""
-        UPDATE conversation_memory
-        SET last_faiss_id=%s,
-            last_message_text=%s,
-            last_topic=%s
-        WHERE id=1
-    """, (last_faiss_id, last_message_text, last_topic))
+# --------------------------------------------------
+# CONVERSATION MEMORY (FOLLOW-UPS)
+# --------------------------------------------------
+# Follow-up pointers live in-process per (session, group). With
+# MEMORY_PERSIST=1 they are also written behind to session_memory so a
+# restarted worker can pick a conversation back up.
 
-    conn.commit()
-    conn.close()
+_EMPTY_MEMORY = {"last_faiss_id": None, "last_message_text": None, "last_topic": None}
 
+class SessionMemoryStore:
+    """
+    Bounded, TTL-evicting store of follow-up state keyed by
+    (session_id, group_id). Reads and writes never touch the database on
+    the request path; persistence, when enabled, happens on a background
+    flush every `flush_seconds`.
+    """
 
+    def __init__(self, max_sessions=MEMORY_MAX_SESSIONS, ttl=MEMORY_TTL_SECONDS,
+                 persist=MEMORY_PERSIST, flush_seconds=MEMORY_FLUSH_SECONDS):
+        self._cache = LRUCache(maxsize=max_sessions, ttl=ttl)
+        self.persist = persist
+        self.flush_seconds = flush_seconds
+        self._dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._flusher = None
+
+    def load(self, session_id, group_id):
+        key = (str(session_id), str(group_id))
+        memory = self._cache.get(key)
+
+        if memory is None and self.persist:
+            memory = self._read_persisted(key)
+            if memory is not None:
+                self._cache.set(key, memory)
+
+        return dict(memory or _EMPTY_MEMORY)
+
+    def save(self, session_id, group_id, memory):
+        key = (str(session_id), str(group_id))
+        memory = {k: memory.get(k) for k in _EMPTY_MEMORY}
+        self._cache.set(key, memory)
+
+        if self.persist:
+            with self._dirty_lock:
+                self._dirty[key] = memory
+            self._start_flusher()
+
+    def flush(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+
+        try:
+            with get_conn() as conn:
+                cur = conn.cursor()
+                cur.executemany("""
+                    REPLACE INTO session_memory
+                    (session_id, group_id, last_faiss_id, last_message_text, last_topic, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                """, [
+                    (sid, gid, m["last_faiss_id"], m["last_message_text"], m["last_topic"], datetime.utcnow())
+                    for (sid, gid), m in dirty.items()
+                ])
+                conn.commit()
+        except Exception as e:
+            print("Session memory flush failed:", e)
+            # Keep newer writes that arrived meanwhile, retry the rest next time
+            with self._dirty_lock:
+                for key, m in dirty.items():
+                    self._dirty.setdefault(key, m)
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats["pending_writes"] = len(self._dirty)
+        return stats
+
+    def _read_persisted(self, key):
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT last_faiss_id, last_message_text, last_topic
+                FROM session_memory WHERE session_id=%s AND group_id=%s
+            """, key)
+            r = cur.fetchone()
+
+        if not r:
+            return None
+        return {"last_faiss_id": r[0], "last_message_text": r[1], "last_topic": r[2]}
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+
+        with self._dirty_lock:
+            if self._flusher is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(self.flush_seconds)
+                    self.flush()
+
+            self._flusher = threading.Thread(target=run, name="session-memory-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+
+session_memory = SessionMemoryStore()
+
+@traced("memory")
+def load_memory(session_id, group_id):
+    return session_memory.load(session_id, group_id)
+
+@traced("memory")
+def save_memory(session_id, group_id, last_faiss_id=None, last_message_text=None, last_topic=None):
+    session_memory.save(session_id, group_id, {
+        "last_faiss_id": last_faiss_id,
+        "last_message_text": last_message_text,
+        "last_topic": last_topic
+    })
+
+def memory_stats():
+    return session_memory.stats()
 
 def get_all_users(group_id: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    cur.execute("""
-        SELECT DISTINCT userName 
-        FROM embeddings 
-        WHERE groupId = %s AND userName != 'system'
-    """, (str(group_id),))
-    
-    rows = cur.fetchall()
-    conn.close()
+        cur.execute("""
+            SELECT DISTINCT userName 
+            FROM embeddings 
+            WHERE groupId = %s AND userName != 'system'
+        """, (str(group_id),))
+        
+        rows = cur.fetchall()
 
     users = [r[0] for r in rows]
     return {"count": len(users), "users": users}
 
 def get_replies_after(faiss_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    cur.execute("""
-        SELECT faiss_id, userName, createdOn, text
-        FROM embeddings
-        WHERE faiss_id > %s
-        ORDER BY faiss_id ASC
-        LIMIT 1
-    """, (faiss_id,))
+        cur.execute("""
+            SELECT faiss_id, userName, createdOn, text
+            FROM embeddings
+            WHERE faiss_id > %s
+            ORDER BY faiss_id ASC
+            LIMIT 1
+        """, (faiss_id,))
 
-    row = cur.fetchone()
-    conn.close()
+        row = cur.fetchone()
 
     if not row:
         return []   
@@ -179,285 +799,1090 @@ def get_replies_after(faiss_id: int):
     }]
 
 def get_topic_start(group_id: str, keyword: str):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        SELECT faiss_id, userName, createdOn, text
-        FROM embeddings
-        WHERE LOWER(text) LIKE %s AND groupId=%s
-        ORDER BY faiss_id ASC
-        LIMIT 1
-    """, (f"%{keyword.lower()}%", str(group_id)))
-
-    row = cur.fetchone()
-    conn.close()
+    """
+    Earliest message of the group containing every term of `keyword`,
+    looked up in the in-memory inverted index instead of a LIKE scan.
+    """
+    snapshot = index_holder.get()
+    faiss_id = snapshot.lexical.first_match(str(group_id), keyword)
 
-    if not row:
+    if faiss_id is None:
         return None
 
+    m = snapshot.metadata[faiss_id]
     return {
-        "faiss_id": row[0],
-        "user": row[1],
-        "time": row[2],
-        "text": row[3]
+        "faiss_id": faiss_id,
+        "user": m["userName"],
+        "time": m["createdOn"],
+        "text": m["text"]
     }
 
 # TIMELINE QUERY (FIXED)
+@traced("hydration")
 def get_messages_by_date(group_id: str, start: str, end: str):
-    ensure_createdOn_dt_column()
+    """
+    (userName, createdOn datetime, text) of the group's messages between
+    `start` and `end` inclusive, oldest first, from the in-memory store.
+    """
+    return index_holder.get().messages.between(str(group_id), start, end)
 
-    conn = get_conn()
-    cur = conn.cursor()
+@traced("hydration")
+def get_first_message(group_id: str):
+    """(faiss_id, userName, createdOn, text) of the group's first non-system message, or None."""
+    return index_holder.get().messages.first(str(group_id))
 
-    cur.execute("""
-        SELECT userName, createdOn_dt, text
-        FROM embeddings
-        WHERE groupId=%s
-          AND createdOn_dt BETWEEN %s AND %s
-          AND userName!='system'
-        ORDER BY createdOn_dt ASC
-    """, (group_id, start, end))
-
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+@traced("hydration")
+def get_next_message(group_id: str, faiss_id: int):
+    """(faiss_id, userName, createdOn, text) of the group's message after `faiss_id`, or None."""
+    return index_holder.get().messages.next_after(str(group_id), faiss_id)
 
 # DB INIT (SAFE FOR RE-INGEST)
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    cur.execute("DROP TABLE IF EXISTS embeddings")
-    cur.execute("DROP TABLE IF EXISTS faiss_index")
+        cur.execute("DROP TABLE IF EXISTS embeddings")
+        cur.execute("DROP TABLE IF EXISTS embedding_vectors")
+        cur.execute("DROP TABLE IF EXISTS faiss_index")
+        cur.execute("DROP TABLE IF EXISTS ingest_progress")
 
-    cur.execute("""
-    CREATE TABLE embeddings (
-        faiss_id INT PRIMARY KEY,
-        chatId VARCHAR(50),
-        groupId VARCHAR(50),
-        userName VARCHAR(255),
-        createdOn VARCHAR(255),
-        createdOn_dt DATETIME,
-        text TEXT,
-        image_url TEXT,
-        image_context TEXT,
-        message_type VARCHAR(50),
-        embedding LONGBLOB
-        )
-    """)
+        conn.commit()
 
-    cur.execute("""
-        CREATE TABLE faiss_index (
-            id INT PRIMARY KEY,
-            index_data LONGBLOB
-        )
-    """)
+    ensure_schema(force=True)
 
-    conn.commit()
-    conn.close()
-    ensure_memory_table()
 # STORE FULL CHAT JSON (RAW BACKUP)
-def store_full_chat_data(json_path="cases.json"):
+def store_full_chat_data(json_path="cases.json", chunk_bytes=RAW_BACKUP_CHUNK_BYTES):
     """
     Stores the complete raw chat JSON into MySQL once.
     Useful for backup, re-ingestion, and debugging.
+
+    The file is streamed in `chunk_bytes` pieces, each zlib-compressed
+    into its own row, so neither the file nor the backup is ever held
+    in memory whole.
     """
 
     if not os.path.exists(json_path):
         print(f" Chat file not found: {json_path}")
         return
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        raw_json = f.read()
+    with get_conn() as conn:
+        cur = conn.cursor()
 
-    conn = get_conn()
-    cur = conn.cursor()
+        # Create table if not exists
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS full_chat_data_chunks (
+                seq INT PRIMARY KEY,
+                data LONGBLOB
+            )
+        """)
 
-    # Create table if not exists
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS full_chat_data (
-            id INT PRIMARY KEY,
-            data LONGTEXT
-        )
-    """)
+        # Check if data already stored
+        cur.execute("SELECT COUNT(*) FROM full_chat_data_chunks")
+        exists = cur.fetchone()[0]
+
+        if exists == 0:
+            with open(json_path, "rb") as f:
+                seq = 0
+                while True:
+                    piece = f.read(chunk_bytes)
+                    if not piece:
+                        break
+                    cur.execute(
+                        "INSERT INTO full_chat_data_chunks (seq, data) VALUES (%s, %s)",
+                        (seq, zlib.compress(piece))
+                    )
+                    seq += 1
+            conn.commit()
+            print(f" Full chat JSON stored in database ({seq} compressed chunks)")
+        else:
+            print("ℹFull chat JSON already exists (skipped)")
+
+def restore_full_chat_data(out_path):
+    """Writes the raw backup back out to `out_path`, one chunk at a time."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT seq FROM full_chat_data_chunks ORDER BY seq")
+        seqs = [r[0] for r in cur.fetchall()]
+
+        with open(out_path, "wb") as f:
+            for seq in seqs:
+                cur.execute("SELECT data FROM full_chat_data_chunks WHERE seq=%s", (seq,))
+                f.write(zlib.decompress(cur.fetchone()[0]))
+    return len(seqs)
 
-    # Check if data already stored
-    cur.execute("SELECT COUNT(*) FROM full_chat_data WHERE id=1")
-    exists = cur.fetchone()[0]
+# INGEST + FAISS
 
-    if exists == 0:
-        cur.execute(
-            "INSERT INTO full_chat_data (id, data) VALUES (1, %s)",
-            (raw_json,)
-        )
+def iter_raw_messages(json_path):
+    """
+    Streams every message of every chat-group block in the export
+    without loading the file; memory stays flat whatever its size.
+    """
+    with open(json_path, "rb") as f:
+        yield from ijson.items(f, "item.data.item", use_float=True)
+
+def _flatten_messages(raw_messages):
+    """Turns raw export messages into the rows stored in `embeddings`."""
+    last_text = None
+
+    for msg in raw_messages:
+        msg_type = msg.get("messageType")
+        text = msg.get("message") or (msg.get("question") or {}).get("message")
+        image_url = msg.get("images")
+
+        image_context = None
+
+        if text:
+            last_text = text
+
+        if msg_type == "image":
+            image_context = msg.get("clinicalNotes") or last_text
+
+        if not text and not image_url:
+            continue
+
+        yield {
+            "chatId": str(msg["chatId"]),
+            "groupId": str(msg["groupId"]),
+            "userName": msg["userName"],
+            "createdOn": msg["createdOn"],
+            "text": text,
+            "image_url": image_url,
+            "image_context": image_context,
+            "message_type": msg_type
+        }
+
+def _chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _message_hash(m):
+    """Fingerprint of everything stored for a message, used to spot edits."""
+    fields = (
+        m["groupId"], m["userName"], m["createdOn"], m["text"],
+        m["image_url"], m["image_context"], m["message_type"]
+    )
+    return hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+def _embedding_content(m):
+    # Decide what to embed
+    return m["text"] or m["image_context"] or "image"
+
+def _parse_created_on(created_on):
+    #  Parse createdOn safely in Python
+    if not created_on:
+        return None
+    return datetime.strptime(
+        created_on.replace("T", " ").replace("Z", ""),
+        "%Y-%m-%d %H:%M:%S"
+    )
+
+def _message_row(faiss_id, m):
+    return (
+        faiss_id,
+        m["chatId"],
+        m["groupId"],
+        m["userName"],
+        m["createdOn"],
+        _parse_created_on(m["createdOn"]),
+        m["text"],
+        m["image_url"],
+        m["image_context"],
+        m["message_type"],
+        _message_hash(m)
+    )
+
+INSERT_MESSAGE_SQL = """
+    INSERT INTO embeddings
+    (
+      faiss_id,
+      chatId,
+      groupId,
+      userName,
+      createdOn,
+      createdOn_dt,
+      text,
+      image_url,
+      image_context,
+      message_type,
+      content_hash
+    )
+    VALUES (
+      %s,%s,%s,%s,
+      %s,%s,
+      %s,%s,%s,%s,%s
+    )
+"""
+
+UPDATE_MESSAGE_SQL = """
+    UPDATE embeddings
+    SET chatId=%s,
+        groupId=%s,
+        userName=%s,
+        createdOn=%s,
+        createdOn_dt=%s,
+        text=%s,
+        image_url=%s,
+        image_context=%s,
+        message_type=%s,
+        content_hash=%s
+    WHERE faiss_id=%s
+"""
+
+INSERT_VECTOR_SQL = "REPLACE INTO embedding_vectors (faiss_id, embedding) VALUES (%s, %s)"
+
+def _vector_rows(ids, vectors):
+    return [(fid, to_blob(emb)) for fid, emb in zip(ids, vectors)]
+
+def _stored_vectors_sql(cur, extra_columns=""):
+    """
+    SELECT of (faiss_id, <extra_columns>, vector) for every message in
+    faiss_id order. Until migrate_vectors() has finished, vectors it has
+    not moved yet are read from the legacy embeddings.embedding column.
+    """
+    vector = "COALESCE(v.embedding, e.embedding)" if _column_exists(cur, "embeddings", "embedding") else "v.embedding"
+    return f"""
+        SELECT e.faiss_id{extra_columns}, {vector}
+        FROM embeddings e
+        LEFT JOIN embedding_vectors v ON v.faiss_id = e.faiss_id
+        ORDER BY e.faiss_id
+    """
+
+def migrate_vectors(batch_size=MIGRATE_BATCH_SIZE, pause=MIGRATE_PAUSE_SECONDS):
+    """
+    Moves vectors from embeddings.embedding to embedding_vectors while the
+    app keeps serving: `batch_size` rows per short transaction, walked by
+    faiss_id, then the old column is dropped with online DDL. Safe to
+    interrupt and re-run; vectors ingest already wrote to the new table
+    are kept. Returns the number of vectors moved.
+    """
+    ensure_schema()
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if not _column_exists(cur, "embeddings", "embedding"):
+            print("✔ Vectors already live in embedding_vectors")
+            return 0
+
+        last, moved = -1, 0
+        while True:
+            cur.execute("""
+                SELECT MAX(faiss_id) FROM (
+                    SELECT faiss_id FROM embeddings WHERE faiss_id > %s ORDER BY faiss_id LIMIT %s
+                ) batch
+            """, (last, batch_size))
+            upper = cur.fetchone()[0]
+            if upper is None:
+                break
+
+            cur.execute("""
+                INSERT IGNORE INTO embedding_vectors (faiss_id, embedding)
+                SELECT faiss_id, embedding FROM embeddings
+                WHERE faiss_id > %s AND faiss_id <= %s AND embedding IS NOT NULL
+            """, (last, upper))
+            moved += max(cur.rowcount, 0)
+            conn.commit()
+
+            last = upper
+            print(f"🛠 Moved vectors up to faiss_id {last}")
+            time.sleep(pause)
+
+        print("🛠 Dropping embeddings.embedding...")
+        cur.execute("ALTER TABLE embeddings DROP COLUMN embedding, ALGORITHM=INPLACE, LOCK=NONE")
         conn.commit()
-        print(" Full chat JSON stored in database")
-    else:
-        print("ℹFull chat JSON already exists (skipped)")
 
-    conn.close()
+    print(f"✔ Moved {moved} vectors to embedding_vectors")
+    return moved
 
-# INGEST + FAISS
+def _new_index(dim):
+    """Flat inner-product index keyed by faiss_id, so ids survive removals."""
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
 
-def ingest_chat(json_path="cases.json"):
-    # Reset DB + tables
-    init_db()
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
 
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def index_type(index):
+    """Which of INDEX_TYPES `index` (or the index inside its id map) is."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
 
-    all_msgs = []
-    last_text = None
+def target_index_type(ntotal):
+    if FAISS_INDEX_TYPE not in INDEX_TYPES:
+        raise ValueError(f"FAISS_INDEX_TYPE must be one of {INDEX_TYPES}, got {FAISS_INDEX_TYPE!r}")
+    return FAISS_INDEX_TYPE if ntotal >= FAISS_ANN_MIN_VECTORS else "flat"
 
-    # STEP 1: FLATTEN CHAT DATA
-    for block in data:
-        for msg in block["data"]:
-            msg_type = msg.get("messageType")
-            text = msg.get("message") or msg.get("question", {}).get("message")
-            image_url = msg.get("images")
+def build_index(vectors, ids, kind, nlist=None, pq_m=None, hnsw_m=None):
+    """
+    Index of type `kind` over already-normalized `vectors`, keyed by `ids`.
+    IVF types are trained on a sample of the vectors first.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+
+    # 8-bit PQ codebooks need ~39 * 256 training points
+    if kind == "ivf_pq" and n < 39 * 256:
+        print(f"⚠ {n} vectors are too few to train IVF-PQ; using ivf_flat")
+        kind = "ivf_flat"
+
+    if kind == "flat":
+        inner = faiss.IndexFlatIP(dim)
+    elif kind == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, hnsw_m or FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    elif kind in ("ivf_flat", "ivf_pq"):
+        # k-means wants ~40 points per list
+        nlist = nlist or FAISS_IVF_NLIST or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf_flat":
+            inner = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            pq_m = pq_m or FAISS_PQ_M or max(1, dim // 8)
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+
+        sample = vectors
+        if n > nlist * 256:
+            sample = vectors[np.random.default_rng(0).choice(n, nlist * 256, replace=False)]
+        inner.train(sample)
+    else:
+        raise ValueError(f"Unknown index type {kind!r}")
+
+    index = faiss.IndexIDMap2(inner)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index
+
+def search_params(index, sel, nprobe=None, ef_search=None):
+    """SearchParameters for `index` restricted to `sel`, with its ANN knobs."""
+    kind = index_type(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=nprobe or FAISS_NPROBE)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=ef_search or FAISS_EF_SEARCH)
+    return faiss.SearchParameters(sel=sel)
+
+def _finalize_index(index):
+    """
+    Converts a flat index that has outgrown FAISS_ANN_MIN_VECTORS into the
+    configured ANN type. Ingest always builds flat (it streams, and IVF
+    needs training data up front); the switch happens here, before saving.
+    """
+    kind = target_index_type(index.ntotal)
+    if kind == "flat" or index_type(index) != "flat":
+        return index
+
+    started = time.perf_counter()
+    vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+    ids = faiss.vector_to_array(index.id_map)
+    index = build_index(vectors, ids, kind)
+    print(f"✔ Built {index_type(index)} index over {index.ntotal} vectors ({time.perf_counter() - started:.1f}s)")
+    return index
+
+def _supports_remove(index):
+    # Only flat storage compacts in step with IndexIDMap2's id_map. HNSW
+    # graphs can't drop nodes, and removing from IVF lists shifts the ids
+    # of other vectors, so both are rebuilt instead
+    return isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+
+def _add_vectors(index, vectors, ids):
+    index.add_with_ids(
+        _normalize(np.array(vectors, dtype="float32")),
+        np.asarray(ids, dtype="int64")
+    )
 
-            image_context = None
+def _save_index(cur, index):
+    """
+    Writes the index to a new versioned file and points faiss_index at it.
+    Only the pointer goes through MySQL; the vectors never leave the disk.
+    """
+    index = _finalize_index(index)
 
-            if text:
-                last_text = text
+    # Generation lets running workers notice the new index and hot-swap it
+    generation = time.time_ns() // 1_000_000
+    path = _index_path(generation)
+    checksum = _write_index_file(index, path)
 
-            if msg_type == "image":
-                image_context = msg.get("clinicalNotes") or last_text
+    cur.execute("""
+        REPLACE INTO faiss_index
+        (id, generation, index_data, file_name, checksum, nbytes, ntotal, index_type, embed_model)
+        VALUES (1, %s, NULL, %s, %s, %s, %s, %s, %s)
+    """, (
+        generation, os.path.basename(path), checksum, os.path.getsize(path),
+        index.ntotal, index_type(index), EMBED_MODEL
+    ))
+
+    _prune_index_files(keep=(generation,))
+    return generation
+
+def _embedded_chunks(chunks):
+    """
+    Yields (chunk, vectors), embedding the next chunk in the background
+    while the caller writes the current one, so the API and the database
+    are busy at the same time. At most one chunk is embedded ahead.
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        embed = lambda chunk: get_embeddings(_embedding_content(m) for m in chunk)
+        pending = None
 
-            if not text and not image_url:
-                continue
+        for chunk in chunks:
+            future = pool.submit(embed, chunk)
+            if pending is not None:
+                yield pending[0], pending[1].result()
+            pending = (chunk, future)
 
-            all_msgs.append({
-                "chatId": msg["chatId"],
-                "groupId": msg["groupId"],
-                "userName": msg["userName"],
-                "createdOn": msg["createdOn"],
-                "text": text,
-                "image_url": image_url,
-                "image_context": image_context,
-                "message_type": msg_type
-            })
-
-    # STEP 2: INSERT + EMBED
-    conn = get_conn()
-    cur = conn.cursor()
-    vectors = []
-
-    for i, m in enumerate(all_msgs):
-
-        # Decide what to embed
-        content_for_embedding = (
-            m["text"]
-            or m["image_context"]
-            or "image"
-        )
+        if pending is not None:
+            yield pending[0], pending[1].result()
 
-        emb = get_embedding(content_for_embedding)
-        vectors.append(emb)
+def _source_fingerprint(json_path):
+    st = os.stat(json_path)
+    return f"{os.path.abspath(json_path)}:{st.st_size}:{int(st.st_mtime)}"
 
-        #  Parse createdOn safely in Python
-        created_on_dt = None
-        if m["createdOn"]:
-            created_on_dt = datetime.strptime(
-                m["createdOn"].replace("T", " ").replace("Z", ""),
-                "%Y-%m-%d %H:%M:%S"
-            )
+def _load_ingest_progress():
+    if not _table_exists("ingest_progress"):
+        return None
 
-        cur.execute("""
-            INSERT INTO embeddings
-            (
-              faiss_id,
-              chatId,
-              groupId,
-              userName,
-              createdOn,
-              createdOn_dt,
-              text,
-              image_url,
-              image_context,
-              message_type,
-              embedding
-            )
-            VALUES (
-              %s,%s,%s,%s,
-              %s,%s,
-              %s,%s,%s,%s,%s
-            )
-        """, (
-            i,
-            m["chatId"],
-            m["groupId"],
-            m["userName"],
-            m["createdOn"],
-            created_on_dt,
-            m["text"],
-            m["image_url"],
-            m["image_context"],
-            m["message_type"],
-            to_blob(emb)
-        ))
-
-    conn.commit()
-
-    # STEP 3: BUILD FAISS INDEX
-    emb_array = _normalize(np.array(vectors, dtype="float32"))
-    index = faiss.IndexFlatIP(emb_array.shape[1])
-    index.add(emb_array)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT source, last_faiss_id, status FROM ingest_progress WHERE id=1")
+        r = cur.fetchone()
 
+    if not r:
+        return None
+    return {"source": r[0], "last_faiss_id": r[1], "status": r[2]}
+
+def _save_ingest_progress(cur, source, last_faiss_id, status):
     cur.execute(
-        "INSERT INTO faiss_index (id, index_data) VALUES (1, %s)",
-        (faiss.serialize_index(index).tobytes(),)
+        "REPLACE INTO ingest_progress (id, source, last_faiss_id, status, updated_at) "
+        "VALUES (1, %s, %s, %s, %s)",
+        (source, last_faiss_id, status, datetime.utcnow())
     )
 
-    conn.commit()
-    conn.close()
+def ingest_chat(json_path="cases.json", chunk_size=INGEST_CHUNK_SIZE, resume=False):
+    """
+    Full rebuild. Messages stream through flatten -> embed -> insert ->
+    index-add `chunk_size` at a time, so peak memory does not grow with
+    the size of the export.
+
+    Each chunk is written with one multi-row INSERT and committed along
+    with a checkpoint. With `resume=True`, a run interrupted on the same
+    unchanged file continues after the last committed chunk instead of
+    starting over.
+    """
+    source = _source_fingerprint(json_path)
+    progress = _load_ingest_progress() if resume else None
 
-    print(f"✔ Ingested {len(vectors)} messages")
-    return len(vectors)
+    if progress and progress["status"] == "running" and progress["source"] == source:
+        start_id = progress["last_faiss_id"] + 1
+        print(f"↻ Resuming ingest after faiss_id {start_id - 1}")
+    else:
+        # Reset DB + tables
+        init_db()
+        start_id = 0
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        # Vectors committed by the interrupted run come back from the table
+        index = _rebuild_index(cur) if start_id else None
+        total = start_id
+
+        _save_ingest_progress(cur, source, start_id - 1, "running")
+        conn.commit()
+
+        # STEP 1: FLATTEN CHAT DATA (streamed); faiss_id == position in the stream
+        messages = itertools.islice(_flatten_messages(iter_raw_messages(json_path)), start_id, None)
+
+        for chunk, vectors in _embedded_chunks(_chunked(messages, chunk_size)):
+            # STEP 2: BULK INSERT + CHECKPOINT
+            ids = range(total, total + len(chunk))
+            cur.executemany(INSERT_MESSAGE_SQL, [_message_row(fid, m) for fid, m in zip(ids, chunk)])
+            cur.executemany(INSERT_VECTOR_SQL, _vector_rows(ids, vectors))
+            _save_ingest_progress(cur, source, ids[-1], "running")
+            conn.commit()
+
+            # STEP 3: ADD TO FAISS INDEX
+            if index is None:
+                index = _new_index(len(vectors[0]))
+            _add_vectors(index, vectors, ids)
+            total += len(chunk)
+
+        if index is not None:
+            _save_index(cur, index)
+        _save_ingest_progress(cur, source, total - 1, "done")
+        conn.commit()
+    index_holder.invalidate()
+
+    print(f"✔ Ingested {total} messages")
+    return total
+
+def _load_index_for_update(cur):
+    """
+    Private, writable copy of the stored index. Indexes written before
+    faiss ids were explicit, or whose file is missing here, are rebuilt
+    from the stored vectors.
+    """
+    pointer = _fetch_index_pointer(cur)
+    index = None
+
+    if pointer and pointer["file_name"]:
+        path = _local_index_path(pointer)
+        if path is not None:
+            index = faiss.read_index(path)
+    elif pointer:
+        cur.execute("SELECT index_data FROM faiss_index WHERE id=1")
+        blob = cur.fetchone()[0]
+        if blob:
+            index = faiss.deserialize_index(np.frombuffer(blob, dtype=np.uint8))
+
+    if isinstance(index, faiss.IndexIDMap2):
+        check_vector_space(pointer["embed_model"], index.d)
+        return index
+    return _rebuild_index(cur)
+
+def _rebuild_index(cur):
+    print("🛠 Rebuilding FAISS index from stored vectors...")
+    cur.execute(_stored_vectors_sql(cur))
+    index = None
+    while True:
+        rows = cur.fetchmany(INGEST_CHUNK_SIZE)
+        if not rows:
+            break
+        rows = [r for r in rows if r[1] is not None]
+        if not rows:
+            continue
+        vectors = [from_blob(r[1]) for r in rows]
+        if index is None:
+            index = _new_index(len(vectors[0]))
+        _add_vectors(index, vectors, [r[0] for r in rows])
+    return index
+
+def ingest_chat_incremental(json_path="cases.json", chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Applies only what changed in `json_path` since the last ingest.
+
+    Messages are matched on chatId: new ones are appended with fresh
+    faiss_ids, edited ones keep their faiss_id and get a new vector, and
+    ones no longer in the export are removed. Tables are never dropped,
+    so search keeps serving the previous generation until the updated
+    index is written. Row changes commit in one transaction with the
+    index, so an interrupted run is simply re-run.
+    """
+    ensure_schema()
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        cur.execute("SELECT chatId, faiss_id, content_hash FROM embeddings")
+        stored = {r[0]: (r[1], r[2]) for r in cur.fetchall()}
+        next_id = max((fid for fid, _ in stored.values()), default=-1) + 1
+
+        # Indexes that can't drop vectors are rebuilt from the rows at the end,
+        # so only a flat one is ever loaded, and only once there is a change
+        pointer = _fetch_index_pointer(cur)
+        patch = pointer is None or pointer["index_type"] in (None, "flat")
+        index = None
+        loaded = False
+
+        def load_index():
+            # Before this run's rows are written, so a rebuild from the
+            # stored vectors doesn't already hold them
+            nonlocal index, patch, loaded
+            if loaded or not patch:
+                return
+            loaded = True
+            index = _load_index_for_update(cur)
+            if index is not None and not _supports_remove(index):
+                index, patch = None, False
+
+        seen = set()
+        counts = {"added": 0, "changed": 0, "removed": 0}
+
+        # STEP 1: DIFF AGAINST WHAT IS STORED (streamed)
+        def pending():
+            nonlocal next_id
+            for m in _flatten_messages(iter_raw_messages(json_path)):
+                seen.add(m["chatId"])
+                prev = stored.get(m["chatId"])
+
+                if prev is None:
+                    yield next_id, m, False
+                    next_id += 1
+                elif prev[1] != _message_hash(m):
+                    yield prev[0], m, True
+
+        # STEP 2: EMBED + WRITE ROWS + PATCH INDEX, chunk by chunk
+        for chunk in _chunked(pending(), chunk_size):
+            vectors = get_embeddings(_embedding_content(m) for _, m, _ in chunk)
+            load_index()
+
+            inserts, updates = [], []
+            for fid, m, is_edit in chunk:
+                row = _message_row(fid, m)
+                if is_edit:
+                    updates.append(row[1:] + (fid,))
+                else:
+                    inserts.append(row)
+
+            if inserts:
+                cur.executemany(INSERT_MESSAGE_SQL, inserts)
+            if updates:
+                cur.executemany(UPDATE_MESSAGE_SQL, updates)
+            cur.executemany(INSERT_VECTOR_SQL, _vector_rows([fid for fid, _, _ in chunk], vectors))
+            counts["added"] += len(inserts)
+            counts["changed"] += len(updates)
+
+            if not patch:
+                continue
+            if index is None:
+                index = _new_index(len(vectors[0]))
+
+            edited = [fid for fid, _, is_edit in chunk if is_edit]
+            if edited:
+                index.remove_ids(np.array(edited, dtype="int64"))
+            _add_vectors(index, vectors, [fid for fid, _, _ in chunk])
+
+        # STEP 3: TOMBSTONE MESSAGES NO LONGER IN THE EXPORT
+        removed = [fid for chat_id, (fid, _) in stored.items() if chat_id not in seen]
+        if removed:
+            load_index()
+            cur.executemany("DELETE FROM embeddings WHERE faiss_id=%s", [(fid,) for fid in removed])
+            cur.executemany("DELETE FROM embedding_vectors WHERE faiss_id=%s", [(fid,) for fid in removed])
+            if index is not None and patch:
+                index.remove_ids(np.array(removed, dtype="int64"))
+            counts["removed"] = len(removed)
+
+        changes = sum(counts.values())
+        if changes:
+            if not patch:
+                index = _rebuild_index(cur)
+            if index is not None:
+                _save_index(cur, index)
+            conn.commit()
+            index_holder.invalidate()
+
+    if changes:
+        print(f"✔ Incremental ingest: {counts['added']} new, {counts['changed']} changed, {counts['removed']} removed")
+    else:
+        print("ℹ No new or changed messages")
+    return changes
 
 # FAISS SEARCH
-def load_faiss_index():
-    conn = get_conn()
-    cur = conn.cursor()
+def _index_path(generation, rebuilt=False):
+    # A rebuilt file can't match the checksum ingest recorded, so it is kept
+    # under its own name instead of shadowing the real one
+    suffix = ".rebuilt.faiss" if rebuilt else ".faiss"
+    return os.path.join(FAISS_INDEX_DIR, f"index-{generation}{suffix}")
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# (path, size, mtime) of files whose checksum this process already verified
+_verified_files = set()
+
+def _checksum_ok(path, checksum):
+    st = os.stat(path)
+    stamp = (path, st.st_size, st.st_mtime_ns)
+    if stamp in _verified_files:
+        return True
+
+    if _file_sha256(path) != checksum:
+        print(f"⚠ Checksum mismatch for {path}")
+        return False
+
+    _verified_files.add(stamp)
+    return True
+
+def _write_index_file(index, path):
+    """
+    Writes `index` straight to `path` (no serialized copy in memory).
+    Returns the sha256 of the file.
+    """
+    os.makedirs(FAISS_INDEX_DIR, exist_ok=True)
+
+    # Write under a private name and rename, so readers never see half a file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    faiss.write_index(index, tmp)
+    checksum = _file_sha256(tmp)
+    os.replace(tmp, path)
+    return checksum
+
+def _fetch_index_pointer(cur=None):
+    """The faiss_index row without the legacy blob, as a dict (None if absent)."""
+    sql = "SELECT generation, file_name, checksum, nbytes, ntotal, index_type, embed_model FROM faiss_index WHERE id=1"
+    if cur is None:
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute(sql)
+            row = c.fetchone()
+    else:
+        cur.execute(sql)
+        row = cur.fetchone()
 
-    cur.execute("SELECT index_data FROM faiss_index WHERE id=1")
-    blob = cur.fetchone()[0]
-    conn.close()
+    if not row:
+        return None
+    return dict(zip(("generation", "file_name", "checksum", "nbytes", "ntotal", "index_type", "embed_model"), row))
 
-    return faiss.deserialize_index(np.frombuffer(blob, dtype=np.uint8))
+def _local_index_path(pointer):
+    """
+    Path of a file on this host that holds the index `pointer` refers to,
+    or None: the recorded file if its checksum matches, else a rebuilt one.
+    """
+    if pointer["file_name"]:
+        path = os.path.join(FAISS_INDEX_DIR, pointer["file_name"])
+    else:
+        path = _index_path(pointer["generation"])
 
-def semantic_search(question: str, group_id: str):
-    index = load_faiss_index()
-    q = _normalize(np.array(get_embedding(question), dtype="float32").reshape(1, -1))
+    if os.path.exists(path) and (not pointer["checksum"] or _checksum_ok(path, pointer["checksum"])):
+        return path
 
-    scores, ids = index.search(q, index.ntotal)
+    rebuilt = _index_path(pointer["generation"], rebuilt=True)
+    return rebuilt if os.path.exists(rebuilt) else None
 
-    conn = get_conn()
-    cur = conn.cursor()
-    results = []
+def _restore_index_file(pointer):
+    """
+    Recreates the local file for `pointer` when this host doesn't have it:
+    from the legacy blob for rows written before index files, otherwise
+    by rebuilding from the stored vectors.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+
+        if not pointer["file_name"]:
+            cur.execute("SELECT index_data FROM faiss_index WHERE id=1")
+            blob = cur.fetchone()[0]
+            index = faiss.deserialize_index(np.frombuffer(blob, dtype=np.uint8))
+            path = _index_path(pointer["generation"])
+        else:
+            print(f"⚠ No usable {pointer['file_name']} in {FAISS_INDEX_DIR}")
+            index = _rebuild_index(cur)
+            index = index if index is None else _finalize_index(index)
+            path = _index_path(pointer["generation"], rebuilt=True)
+
+    if index is None:
+        raise RuntimeError("FAISS index has no vectors. Run init_db.py to ingest chats first.")
+
+    _write_index_file(index, path)
+    _prune_index_files(keep=(pointer["generation"],))
+    return path
+
+def _prune_index_files(keep, spare=1):
+    """
+    Removes index files of older generations, leaving `spare` of them for
+    workers that have not swapped yet (already mapped files stay readable).
+    Files newer than the newest of `keep` are never touched: another
+    process may have published them since our pointer was read.
+    """
+    try:
+        names = [n for n in os.listdir(FAISS_INDEX_DIR) if n.startswith("index-") and n.endswith(".faiss")]
+    except FileNotFoundError:
+        return
 
-    for score, idx in zip(scores[0], ids[0]):
+    newest = max(keep)
+    generations = sorted(
+        {g for g in (int(n[len("index-"):].split(".")[0]) for n in names) if g < newest},
+        reverse=True
+    )
+    stale = set(generations[spare:])
+    for name in names:
+        if int(name[len("index-"):].split(".")[0]) in stale:
+            try:
+                os.remove(os.path.join(FAISS_INDEX_DIR, name))
+            except OSError:
+                pass
+
+def _fetch_faiss_index():
+    """
+    Opens the index file faiss_index points at, after checking it against
+    the recorded checksum. The file is memory-mapped read-only
+    (FAISS_INDEX_MMAP), so loading copies nothing and workers share it.
+    Returns (index, generation, size_in_bytes).
+    """
+    pointer = _fetch_index_pointer()
+    if pointer is None:
+        raise RuntimeError("FAISS index not found. Run init_db.py to ingest chats first.")
+
+    path = _local_index_path(pointer) or _restore_index_file(pointer)
+
+    flags = 0
+    if FAISS_INDEX_MMAP:
+        # IVF maps its inverted lists; flat and HNSW map their vector storage
+        is_ivf = (pointer["index_type"] or "flat").startswith("ivf")
+        flags = (faiss.IO_FLAG_MMAP if is_ivf else faiss.IO_FLAG_MMAP_IFC) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(path, flags)
+
+    # Never serve an index the active embedder can't produce queries for
+    check_vector_space(pointer["embed_model"], index.d)
+    return index, pointer["generation"], os.path.getsize(path)
+
+def _fetch_index_generation():
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT generation FROM faiss_index WHERE id=1")
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def _fetch_metadata():
+    """
+    Loads the per-message fields search results need, keyed by faiss_id.
+    One query per index load instead of one per hit per request.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
         cur.execute("""
-            SELECT faiss_id,userName,createdOn,text,image_url,image_context
+            SELECT faiss_id, groupId, userName, createdOn, text, image_url, image_context, content_hash
             FROM embeddings
-            WHERE faiss_id=%s AND groupId=%s
-        """, (int(idx), group_id))
+            ORDER BY faiss_id
+        """)
+
+        metadata = {}
+        for r in cur.fetchall():
+            metadata[r[0]] = {
+                "groupId": r[1],
+                "userName": r[2],
+                "createdOn": r[3],
+                "text": r[4],
+                "image_url": r[5],
+                "image_context": r[6],
+                "content_hash": r[7]
+            }
+    return metadata
+
+# --------------------------------------------------
+# PROCESS-RESIDENT INDEX CACHE
+# --------------------------------------------------
+class IndexSnapshot:
+    """One generation of the index together with the rows it points at."""
+
+    def __init__(self, index, generation, metadata):
+        self.index = index
+        self.generation = generation
+        self.metadata = metadata
+
+        # Per-group id selectors so a search only scores that group's vectors
+        group_ids, image_ids, digests = {}, {}, {}
+        for faiss_id, m in metadata.items():
+            group_ids.setdefault(m["groupId"], []).append(faiss_id)
+            if m["image_url"]:
+                image_ids.setdefault(m["groupId"], []).append(faiss_id)
+            digests.setdefault(m["groupId"], hashlib.sha1()).update(
+                f"{faiss_id}:{m['content_hash']};".encode("utf-8")
+            )
+
+        # Fingerprint of each group's rows, to tell which groups an ingest touched
+        self.group_versions = {g: d.hexdigest() for g, d in digests.items()}
+
+        self.group_sizes = {g: len(ids) for g, ids in group_ids.items()}
+        self.image_counts = {g: len(ids) for g, ids in image_ids.items()}
+        self._selectors = {
+            (g, False): faiss.IDSelectorBatch(np.array(ids, dtype="int64"))
+            for g, ids in group_ids.items()
+        }
+        self._selectors.update({
+            (g, True): faiss.IDSelectorBatch(np.array(ids, dtype="int64"))
+            for g, ids in image_ids.items()
+        })
+
+        # Lexical side of hybrid search, over exactly the same messages
+        self.lexical = BM25Index((fid, m["groupId"], m["text"]) for fid, m in metadata.items())
+
+        # Timeline and first/next-message lookups, also over the same messages
+        self.messages = MessageStore(
+            (fid, m["groupId"], m["userName"], m["createdOn"], m["text"]) for fid, m in metadata.items()
+        )
+
+    def search(self, q, group_id, top_k, images_only=False):
+        """
+        Returns (scores, ids) for the best `top_k` vectors of one group.
+        Vectors outside the group are never scored.
+        """
+        sel = self._selectors.get((group_id, images_only))
+        if sel is None:
+            return [], []
+
+        size = (self.image_counts if images_only else self.group_sizes)[group_id]
+        k = min(top_k, size)
+        scores, ids = self.index.search(q, k, params=search_params(self.index, sel))
+        return scores[0], ids[0]
+
+class IndexHolder:
+    """
+    Keeps the FAISS index and its message metadata loaded once per process.
+
+    The stored generation is polled at most every `refresh_seconds`;
+    when ingest writes a new one the index is loaded off to the side and
+    swapped in with a single reference assignment, so searches already
+    holding the old index finish undisturbed.
+    """
+
+    def __init__(self, refresh_seconds=FAISS_INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+        self._listeners = []
+        self._stats = {
+            "generation": None,
+            "bytes": 0,
+            "ntotal": 0,
+            "messages": 0,
+            "load_seconds": None,
+            "loaded_at": None,
+            "loads": 0,
+        }
+
+    def get(self):
+        if self._snapshot is None or time.monotonic() - self._checked_at >= self.refresh_seconds:
+            with span("index_load"):
+                self._refresh()
+        return self._snapshot
+
+    def invalidate(self):
+        """Forces a generation check on the next get()."""
+        self._checked_at = 0.0
+
+    def on_groups_changed(self, listener):
+        """Registers listener(group_ids), called after a swap changed those groups."""
+        self._listeners.append(listener)
+
+    def stats(self):
+        return dict(self._stats)
+
+    def _refresh(self):
+        # Only block when there is nothing to serve yet; otherwise let one
+        # thread do the check and keep answering from the current index.
+        if not self._load_lock.acquire(blocking=self._snapshot is None):
+            return
+
+        try:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+                return
+
+            try:
+                generation = _fetch_index_generation()
+                if self._snapshot is None or generation != self._snapshot.generation:
+                    self._load()
+            except Exception as e:
+                # An ingest may be rebuilding the tables; keep serving what we have
+                if self._snapshot is None:
+                    raise
+                print("FAISS index refresh failed, keeping current index:", e)
+
+            self._checked_at = time.monotonic()
+        finally:
+            self._load_lock.release()
+
+    def _load(self):
+        started = time.perf_counter()
+        index, generation, nbytes = _fetch_faiss_index()
+        metadata = _fetch_metadata()
+        elapsed = time.perf_counter() - started
+
+        previous, snapshot = self._snapshot, IndexSnapshot(index, generation, metadata)
+        stats = {
+            "generation": generation,
+            "bytes": nbytes,
+            "ntotal": index.ntotal,
+            "messages": len(metadata),
+            "message_store_bytes": snapshot.messages.stats()["bytes"],
+            "load_seconds": round(elapsed, 4),
+            "loaded_at": datetime.utcnow().isoformat() + "Z",
+            "loads": self._stats["loads"] + 1,
+        }
+        self._snapshot = snapshot
+        self._stats = stats
+        print(f"✔ Loaded FAISS index generation {generation} ({nbytes} bytes, {elapsed:.2f}s)")
+
+        if previous is not None:
+            old, new = previous.group_versions, snapshot.group_versions
+            changed = [g for g in old.keys() | new.keys() if old.get(g) != new.get(g)]
+            if changed:
+                for listener in self._listeners:
+                    listener(changed)
+
+index_holder = IndexHolder()
+index_holder.on_groups_changed(answer_cache.invalidate_groups)
+
+def index_stats():
+    return index_holder.stats()
+
+def _query_matrix(snapshot, question, query_vector):
+    if query_vector is None:
+        query_vector = get_embedding(question)
+    q = _normalize(np.array(query_vector, dtype="float32").reshape(1, -1))
+    if q.shape[1] != snapshot.index.d:
+        raise ValueError(f"Query vector is {q.shape[1]}-d but the index holds {snapshot.index.d}-d vectors")
+    return q
+
+def _search_result(snapshot, faiss_id, score):
+    m = snapshot.metadata[faiss_id]
+    return {
+        "faiss_id": faiss_id,
+        "score": float(score),   # 🔥 IMPORTANT
+        "metadata": {
+            "userName": m["userName"],
+            "createdOn": m["createdOn"],
+            "text": m["text"],
+            "image_url": m["image_url"],
+            "image_context": m["image_context"]
+        }
+    }
+
+def semantic_search(question: str, group_id: str, top_k=SEARCH_TOP_K, min_score=None, images_only=False,
+                    query_vector=None):
+    """
+    Returns up to `top_k` messages of `group_id` ranked by similarity.
+    Hits scoring below `min_score` are dropped; `images_only` restricts
+    the search to messages that carry an image. Pass `query_vector` when
+    the question has already been embedded.
+    """
+    snapshot = index_holder.get()
+    q = _query_matrix(snapshot, question, query_vector)
+
+    with span("search"):
+        scores, ids = snapshot.search(q, group_id, top_k, images_only)
+
+    with span("hydration"):
+        results = []
+        for score, idx in zip(scores, ids):
+            if idx < 0 or (min_score is not None and score < min_score):
+                continue
+            results.append(_search_result(snapshot, int(idx), score))
 
-        r = cur.fetchone()
-        if r:
-            results.append({
-                "faiss_id": r[0],
-                "score": float(score),   # 🔥 IMPORTANT
-                "metadata": {
-                    "userName": r[1],
-                    "createdOn": r[2],
-                    "text": r[3],
-                    "image_url": r[4],
-                    "image_context": r[5]
-                }
-            })
-
-    conn.close()
     return results
 
+def hybrid_search(question: str, group_id: str, top_k=SEARCH_TOP_K, query_vector=None):
+    """
+    Vector and BM25 retrieval over `group_id`, fused with reciprocal rank
+    fusion: messages that share exact terms with the question (drug
+    names, stent sizes, abbreviations) rank high even when their
+    embedding is not the closest. Results are shaped like
+    semantic_search's, with the fused score.
+    """
+    snapshot = index_holder.get()
+    q = _query_matrix(snapshot, question, query_vector)
+
+    with span("search"):
+        _, vector_ids = snapshot.search(q, group_id, HYBRID_CANDIDATES)
+        _, lexical_ids = snapshot.lexical.search(question, group_id, HYBRID_CANDIDATES)
+
+        fused = reciprocal_rank_fusion(
+            [[int(i) for i in vector_ids if i >= 0], [int(i) for i in lexical_ids]],
+            k=HYBRID_RRF_K
+        )
+        best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+
+    with span("hydration"):
+        return [_search_result(snapshot, faiss_id, score) for faiss_id, score in best]